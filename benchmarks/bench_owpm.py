@@ -0,0 +1,554 @@
+"""
+bench_owpm.py
+=============
+Benchmarks of owpm's lock and build paths against a local stand-in pypi json
+and file server with synthetic projects, so performance can be tracked over
+time without touching the real network.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import click
+
+OWPM_PATH = Path(__file__).resolve().parent.parent / "owpm.py"  # Path to benched owpm
+IMPORT_BUDGET = 50  # max ms of `import owpm` measured by `python -X importtime`
+STARTUP_BUDGET = 50  # max ms a read-only command adds to interpreter startup
+
+"""Heavy dependencies owpm must only import on the code paths needing them,
+importing any of these on `import owpm` fails the startup check"""
+LAZY_MODULES = (
+    "requests",
+    "pexpect",
+    "shellingham",
+    "toml",
+    "packaging",
+    "venv",
+    "sqlite3",
+)
+
+"""Default scenarios ran when no size is given as `(name, packages, shape,
+releases, build)`"""
+SCENARIOS = (
+    ("wide-10", 10, "wide", 5, True),
+    ("tree-200", 200, "tree", 5, False),
+    ("deep-100", 100, "deep", 5, False),
+    ("releases-50x2000", 50, "wide", 2000, False),
+)
+
+
+class FakeIndex:
+    """A stand-in pypi serving the json api and wheel files of synthetic
+    packages from a background thread, counting every request it answers"""
+
+    def __init__(self, projects: dict, wheels: dict):
+        self.projects = projects  # name: project json
+        self.wheels = wheels  # filename: wheel bytes
+        self.counts = {}  # route: amount of requests
+
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/pypi"
+
+    def start(self):
+        """Starts serving in the background"""
+
+        self._thread.start()
+
+    def stop(self):
+        """Stops serving and closes the socket"""
+
+        self._server.shutdown()
+        self._server.server_close()
+
+    def take_counts(self) -> dict:
+        """Gets the request counts since last taken and resets them"""
+
+        with self._lock:
+            counts, self.counts = self.counts, {}
+
+        return counts
+
+    def _count(self, route: str):
+        """Adds a request to the counts of a route"""
+
+        with self._lock:
+            self.counts[route] = self.counts.get(route, 0) + 1
+
+    def _make_handler(self) -> type:
+        """Makes the request handler class bound to this index"""
+
+        index = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *_):
+                pass
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+
+                if parts[0] == "files" and len(parts) == 2:
+                    index._count("file")
+                    self._send(index.wheels.get(parts[1]))
+                elif parts[0] == "pypi" and len(parts) == 3:
+                    index._count("project")
+                    self._send_json(index.projects.get(parts[1]))
+                elif parts[0] == "pypi" and len(parts) == 4:
+                    index._count("release")
+                    project_json = index.projects.get(parts[1])
+                    self._send_json(_release_json(project_json, parts[2]))
+                else:
+                    index._count("other")
+                    self._send(None)
+
+            def _send_json(self, found: dict):
+                if found is None:
+                    return self._send(None)
+
+                body = json.dumps(found).encode()
+                etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+                if self.headers.get("If-None-Match") == etag:
+                    index._count("not_modified")
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self._send(body, etag)
+
+            def _send(self, body: bytes, etag: str = None):
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+
+                if etag is not None:
+                    self.send_header("ETag", etag)
+
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def make_packages(count: int, shape: str, releases: int) -> tuple:
+    """Makes `count` synthetic packages as a tuple of project json by name,
+    wheel bytes by filename and top-level names. Shaped `wide`, `deep` or as
+    a 4-ary `tree`, only the newest of `releases` has a real wheel"""
+
+    names = [f"bench-pkg-{num}" for num in range(count)]
+    requires = {name: [] for name in names}
+
+    if shape == "deep":
+        roots = names[:1]
+
+        for num, name in enumerate(names[1:]):
+            requires[names[num]].append(f"{name} (>=1.0)")
+    elif shape == "tree":
+        roots = names[:1]
+
+        for num, name in enumerate(names[1:], 1):
+            requires[names[(num - 1) // 4]].append(f"{name} (>=1.0)")
+    else:
+        roots = names
+
+    projects = {}
+    wheels = {}
+
+    for name in names:
+        versions = [f"1.{num}" for num in range(releases)]
+        release_files = {}
+
+        for version in versions[:-1]:
+            release_files[version] = [
+                _file_json(name, version, hashlib.sha256(version.encode()).hexdigest())
+            ]  # never selected, no need for a real wheel
+
+        filename, wheel = _make_wheel(name, versions[-1])
+        wheels[filename] = wheel
+        release_files[versions[-1]] = [
+            _file_json(name, versions[-1], hashlib.sha256(wheel).hexdigest())
+        ]
+
+        projects[name] = {
+            "info": {
+                "name": name,
+                "version": versions[-1],
+                "requires_dist": requires[name] or None,
+            },
+            "releases": release_files,
+            "urls": release_files[versions[-1]],
+        }
+
+    return (projects, wheels, roots)
+
+
+def run_owpm(bench_dir: Path, index: FakeIndex, *args: str) -> dict:
+    """Runs owpm from a copy in bench_dir against the index, returning its
+    wall time, peak memory and requests made"""
+
+    env = dict(os.environ, OWPM_INDEX_URL=index.url)
+    index.take_counts()
+
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, str(bench_dir / "owpm.py"), *args],
+        cwd=bench_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    stderr = proc.stderr.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if proc.returncode != 0:
+        raise click.ClickException(
+            f"'owpm {' '.join(args)}' failed with:\n{stderr.decode(errors='replace')}"
+        )
+
+    return {
+        "seconds": round(elapsed, 4),
+        "peak_rss_kb": usage.ru_maxrss,
+        "requests": index.take_counts(),
+    }
+
+
+def bench_scenario(
+    name: str, packages: int, shape: str, releases: int, build: bool
+) -> dict:
+    """Benches a single scenario in a fresh owpm directory, cold lock then a
+    forced lock with warm metadata, a smart lock and optionally a build"""
+
+    projects, wheels, roots = make_packages(packages, shape, releases)
+    index = FakeIndex(projects, wheels)
+    index.start()
+
+    results = {"scenario": name, "packages": packages, "shape": shape}
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="owpm_bench_") as bench_dir:
+            bench_dir = Path(bench_dir)
+            shutil.copy(OWPM_PATH, bench_dir / "owpm.py")
+            _write_project(bench_dir / "bench.owpm", roots)
+
+            results["lock_cold"] = run_owpm(bench_dir, index, "lock", "-f")
+            results["lock_warm"] = run_owpm(bench_dir, index, "lock", "-f")
+            results["lock_smart"] = run_owpm(bench_dir, index, "lock")
+
+            if build:
+                results["build"] = run_owpm(bench_dir, index, "build")
+    finally:
+        index.stop()
+
+    return results
+
+
+def bench_startup() -> dict:
+    """Measures startup of a fresh owpm copy, giving the ms of `import owpm`,
+    which LAZY_MODULES it imported and the best ms a read-only command adds
+    ran as a module and as a script, which compiles owpm.py every time"""
+
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # bytecode is cached when installed
+
+    with tempfile.TemporaryDirectory(prefix="owpm_bench_") as bench_dir:
+        shutil.copy(OWPM_PATH, Path(bench_dir) / "owpm.py")
+
+        def run(*args: str) -> subprocess.CompletedProcess:
+            return subprocess.run(
+                [sys.executable, *args],
+                cwd=bench_dir,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                check=True,
+            )
+
+        run("-c", "import owpm")  # compiles owpm into __pycache__
+        import_ms, eager = min(
+            _parse_importtime(
+                run("-X", "importtime", "-c", "import owpm").stderr.decode()
+            )
+            for _ in range(5)
+        )
+
+        baseline = _best_time(run, "-c", "pass")  # interpreter startup alone
+        module_ms = _best_time(run, "-m", "owpm", "venv-list") - baseline
+        script_ms = _best_time(run, "owpm.py", "venv-list") - baseline
+
+    return {
+        "import_ms": import_ms,
+        "eager_modules": eager,
+        "command_ms": max(module_ms, 0.0),
+        "compile_ms": max(script_ms - module_ms, 0.0),
+    }
+
+
+def _parse_importtime(stderr: str) -> tuple:
+    """Gets the cumulative ms of owpm and the LAZY_MODULES it imported from the
+    output of `python -X importtime -c "import owpm"`"""
+
+    import_ms = 0.0
+    eager = set()
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        elif name.strip() == "owpm":
+            import_ms = int(cumulative) / 1000
+        elif name.strip().split(".")[0] in LAZY_MODULES:
+            eager.add(name.strip().split(".")[0])
+
+    return (import_ms, sorted(eager))
+
+
+def _best_time(run, *args: str) -> float:
+    """Gets the best of 7 wall times in ms of running a command"""
+
+    times = []
+
+    for _ in range(7):
+        started = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - started)
+
+    return min(times) * 1000
+
+
+def _release_json(project_json: dict, version: str) -> dict:
+    """Makes the json of a single release from a project's json, like pypi's
+    `/pypi/<name>/<version>/json`"""
+
+    if project_json is None or version not in project_json["releases"]:
+        return None
+
+    newest = version == project_json["info"]["version"]
+
+    return {
+        "info": dict(
+            project_json["info"],
+            version=version,
+            requires_dist=project_json["info"]["requires_dist"] if newest else None,
+        ),
+        "urls": project_json["releases"][version],
+    }
+
+
+def _file_json(name: str, version: str, digest: str) -> dict:
+    """Makes the pypi json of a single wheel file"""
+
+    filename = f"{name.replace('-', '_')}-{version}-py3-none-any.whl"
+
+    return {
+        "filename": filename,
+        "url": f"/files/{filename}",
+        "packagetype": "bdist_wheel",
+        "yanked": False,
+        "digests": {"sha256": digest},
+    }
+
+
+def _make_wheel(name: str, version: str) -> tuple:
+    """Makes a minimal installable wheel, returning its filename and bytes"""
+
+    module = name.replace("-", "_")
+    dist_info = f"{module}-{version}.dist-info"
+    files = {
+        f"{module}/__init__.py": f"VERSION = '{version}'\n",
+        f"{dist_info}/METADATA": "Metadata-Version: 2.1\n"
+        f"Name: {name}\nVersion: {version}\n",
+        f"{dist_info}/WHEEL": "Wheel-Version: 1.0\nGenerator: bench_owpm\n"
+        "Root-Is-Purelib: true\nTag: py3-none-any\n",
+    }
+    files[f"{dist_info}/RECORD"] = "".join(f"{path},,\n" for path in files) + (
+        f"{dist_info}/RECORD,,\n"
+    )
+
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, "w") as wheel:
+        for path, content in files.items():
+            wheel.writestr(zipfile.ZipInfo(path, (2020, 1, 1, 0, 0, 0)), content)
+
+    return (f"{module}-{version}-py3-none-any.whl", buffer.getvalue())
+
+
+def _write_project(owpm_path: Path, roots: list):
+    """Writes a .owpm file with the given top-level packages"""
+
+    lines = ['desc = "owpm benchmark"', 'version = "0.1.0"', 'lockfile_hash = ""', ""]
+    lines.append("[packages]")
+    lines.extend(f'{root} = "*"' for root in roots)
+
+    owpm_path.write_text("\n".join(lines) + "\n")
+
+
+def _print_results(results: list):
+    """Prints a table of benchmark results"""
+
+    print(f"{'scenario':>18}{'run':>12}{'seconds':>10}{'peak MiB':>10}  requests")
+
+    for result in results:
+        for run in ("lock_cold", "lock_warm", "lock_smart", "build"):
+            if run not in result:
+                continue
+
+            found = result[run]
+            requests = ", ".join(
+                f"{route}={amount}"
+                for route, amount in sorted(found["requests"].items())
+            )
+            print(
+                f"{result['scenario']:>18}{run:>12}{found['seconds']:>10.3f}"
+                f"{found['peak_rss_kb'] / 1024:>10.1f}  {requests or '-'}"
+            )
+
+
+@click.command()
+@click.option(
+    "--packages",
+    "-n",
+    help="Synthetic packages of a custom scenario (up to 5000)",
+    type=click.IntRange(1, 5000),
+)
+@click.option(
+    "--shape",
+    help="Dependancy graph shape of a custom scenario",
+    type=click.Choice(["wide", "deep", "tree"]),
+    default="tree",
+)
+@click.option(
+    "--releases",
+    "-r",
+    help="Releases of every package of a custom scenario",
+    type=click.IntRange(min=1),
+    default=5,
+)
+@click.option(
+    "--build",
+    "-b",
+    help="Also benches building a venv in a custom scenario",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--import-budget",
+    help=f"Max ms of importing owpm by -X importtime (default {IMPORT_BUDGET})",
+    type=float,
+    default=IMPORT_BUDGET,
+)
+@click.option(
+    "--startup-budget",
+    help=f"Max ms a read-only command adds to startup (default {STARTUP_BUDGET})",
+    type=float,
+    default=STARTUP_BUDGET,
+)
+@click.option(
+    "--startup-only",
+    help="Only runs the startup checks, skipping every scenario",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--json",
+    "json_path",
+    help="Saves results as json to this path",
+    type=click.Path(dir_okay=False),
+)
+def bench(
+    packages,
+    shape,
+    releases,
+    build,
+    import_budget,
+    startup_budget,
+    startup_only,
+    json_path,
+):
+    """Benches owpm's lock and build paths, running the default scenarios
+    unless a custom amount of packages is given. Fails if owpm starts slower
+    than its budgets or imports a heavy dependency eagerly"""
+
+    if startup_only:
+        scenarios = ()
+    elif packages is None:
+        scenarios = SCENARIOS
+    else:
+        scenarios = (
+            (f"{shape}-{packages}x{releases}", packages, shape, releases, build),
+        )
+
+    startup = bench_startup()
+    print(
+        f"Importing owpm takes {startup['import_ms']:.1f}ms "
+        f"(budget {import_budget:.0f}ms)..\n"
+        f"A read-only command adds {startup['command_ms']:.1f}ms to startup "
+        f"(budget {startup_budget:.0f}ms)..\n"
+        f"Running owpm.py as a script adds {startup['compile_ms']:.1f}ms more to "
+        "compile it, `python -m owpm` uses cached bytecode.."
+    )
+
+    results = []
+
+    for scenario in scenarios:
+        print(f"Benching '{scenario[0]}'..")
+        results.append(bench_scenario(*scenario))
+
+    if results:
+        _print_results(results)
+
+    if json_path is not None:
+        with open(json_path, "w+") as file:
+            json.dump({"startup": startup, "scenarios": results}, file, indent=2)
+
+        print(f"Saved results to '{json_path}'!")
+
+    if startup["eager_modules"]:
+        raise click.ClickException(
+            f"Importing owpm also imported {', '.join(startup['eager_modules'])}, "
+            "these must only be imported when needed!"
+        )
+    elif startup["import_ms"] > import_budget:
+        raise click.ClickException(
+            f"Importing owpm took {startup['import_ms']:.1f}ms, "
+            f"over the {import_budget:.0f}ms budget!"
+        )
+    elif startup["command_ms"] > startup_budget:
+        raise click.ClickException(
+            f"A read-only command added {startup['command_ms']:.1f}ms to startup, "
+            f"over the {startup_budget:.0f}ms budget!"
+        )
+
+
+if __name__ == "__main__":
+    bench()
@@ -5,38 +5,109 @@ The core module of owpm, used for everything apart from outside documentation/
 build scripts in the scope of owpm.
 """
 
+from __future__ import annotations
+
 import hashlib
+import json
 import os
+import platform
 import random
+import re
 import shutil
-import sqlite3
-import subprocess
 import sys
 import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from venv import EnvBuilder
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin
 
 import click
-import pexpect
-import requests
-import shellingham
-import toml
-from packaging.requirements import Requirement
-from packaging.version import parse as pkg_parse
+
+if TYPE_CHECKING:  # heavy imports are only made by the code paths using them
+    import sqlite3
+    from concurrent.futures import Executor
+
+    import requests
+    from packaging.specifiers import SpecifierSet
 
 """The current source compatibility level, used for breaking changes to lockfile"""
-OWPM_LOCKFILE_VERSION = 1
+OWPM_LOCKFILE_VERSION = 2
+
+"""Tables of the current lockfile specification, normalized into packages,
+their downloadable artifacts and dependency edges between packages. `meta`
+holds the `content_hash` of the locked rows"""
+LOCKFILE_SCHEMA = (
+    "CREATE TABLE package ( id integer PRIMARY KEY, name text NOT NULL, "
+    "version text NOT NULL, requirement text, is_dev int NOT NULL, is_dep int NOT NULL )",
+    "CREATE UNIQUE INDEX package_name_version ON package ( name, version )",
+    "CREATE INDEX package_filter ON package ( is_dev, is_dep, name )",
+    "CREATE TABLE artifact ( id integer PRIMARY KEY, "
+    "package_id integer NOT NULL REFERENCES package ( id ), filename text, "
+    "url text, packagetype text, digest text NOT NULL )",
+    "CREATE UNIQUE INDEX artifact_digest ON artifact ( digest )",
+    "CREATE INDEX artifact_package ON artifact ( package_id )",
+    "CREATE TABLE dependency ( parent_id integer NOT NULL REFERENCES package ( id ), "
+    "child_id integer NOT NULL REFERENCES package ( id ), PRIMARY KEY ( parent_id, child_id ) )",
+    "CREATE INDEX dependency_child ON dependency ( child_id )",
+    "CREATE TABLE meta ( key text PRIMARY KEY, value text )",
+)
 
-BUF_SIZE = 65536  # lockfile_hash buffer size
+BUF_SIZE = 65536  # file read buffer size
+FICLONE = 0x40049409  # linux ioctl for reflinking files
+DEFAULT_JOBS = 16  # default worker count used when locking packages
+LOCK_BATCH_SIZE = 256  # max rows written to a lockfile by one executemany
 
 BASE_PATH = Path(os.path.dirname(os.path.abspath(sys.argv[0])))  # Path to owpm dir
 
 VENV_PATH = BASE_PATH / "owpm_venv"  # Path for virtual machines
 TOML_PATH = BASE_PATH / "owpm_venv.toml"  # Path for toml cache
+VENV_LOCKS_PATH = BASE_PATH / "owpm_venv_locks"  # Path for lockfiles of cached venvs
 TEMP_REQUIRE = (
     BASE_PATH / "owpm_temp_require.txt"
 )  # Path for temporary requirements.txt
+CACHE_PATH = BASE_PATH / "owpm_cache.db"  # Path for cached pypi metadata
+STORE_PATH = BASE_PATH / "owpm_store"  # Path for downloaded packages by sha256
+DAEMON_SOCKET = BASE_PATH / "owpm_daemon.sock"  # Path for the daemon's unix socket
+PROJECT_CACHE_PATH = BASE_PATH / "owpm_projects"  # Path for parsed .owpm files
+
+DAEMON_COMMANDS = (
+    "lock",
+    "build",
+    "add",
+    "rem",
+    "pkg-list",
+    "graph",
+    "venv-list",
+    "clean",
+    "workspace",
+)  # commands forwarded to a running daemon, never interactive ones
+
+VENV_CACHE_BUDGET = int(
+    os.environ.get("OWPM_VENV_BUDGET", 2 * 1024 * 1024 * 1024)
+)  # bytes of cached venvs kept before the least recently used are deleted
+
+PYPI_URL = os.environ.get(
+    "OWPM_INDEX_URL", "https://pypi.org/pypi"
+)  # Base of the pypi json api, may be changed to use a stand-in index
+HTTP_BACKEND = os.environ.get(
+    "OWPM_HTTP_BACKEND", "session"
+)  # `session` for pooled threads or `async` for httpx, if installed
+INSTALLER = os.environ.get(
+    "OWPM_INSTALLER", "native"
+)  # `native` unpacks wheels itself, `pip` installs everything using pip
+POOL_SIZE = int(os.environ.get("OWPM_POOL_SIZE", 32))  # max pooled http connections
+HTTP_RETRIES = 3  # retries of a pypi request on 429/5xx responses
+HTTP_BACKOFF = 0.5  # backoff factor in seconds between retries
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+CACHE_TTL = 600  # seconds before cached pypi metadata is revalidated
+STREAM_MIN_SIZE = 1024 * 1024  # bytes of pypi json streamed with ijson, if installed
+CACHE_MAX_SIZE = 256 * 1024 * 1024  # bytes of pypi metadata kept before eviction
+CACHE_VERSION = 2  # schema of the metadata cache, older caches are emptied
+
+PROFILE_PATH = os.environ.get("OWPM_PROFILE")  # json profile report path, if any
+PROFILE_TOP = 10  # slowest packages shown in the profile summary
 
 
 class ExceptionApiDown(Exception):
@@ -95,6 +166,564 @@ class ExceptionCorruptPackage(Exception):
     pass
 
 
+class ExceptionLockFailed(Exception):
+    """When one or more packages could not be locked, the message lists every
+    failed package alongside its error"""
+
+    pass
+
+
+class ExceptionBuildFailed(Exception):
+    """When one or more packages could not be downloaded, installed or built
+    into a venv, the message lists every failed package alongside its error"""
+
+    pass
+
+
+class ExceptionOfflineCacheMiss(Exception):
+    """When running offline and the wanted pypi metadata has not been cached"""
+
+    pass
+
+
+class Profiler:
+    """Records per-package wall time of each phase of locking and building
+    alongside counters such as cache hits and bytes transferred, safe to use
+    from any thread. Does nothing until started with a report path"""
+
+    def __init__(self):
+        self.path = None
+        self.packages = {}  # normalized name: {phase: seconds}
+        self.phases = {}  # phase: total seconds
+        self.counters = {}  # counter: amount
+
+        self._lock = threading.Lock()
+        self._started = 0.0
+
+    def start(self, path: Path):
+        """Starts recording, the report will be written to path once saved"""
+
+        self.path = Path(path)
+        self.packages = {}
+        self.phases = {}
+        self.counters = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def time(self, package: str, phase: str):
+        """Times a block as the given phase of a package, use as a context
+        manager. Package may be None for phases not done per-package"""
+
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add_time(package, phase, time.perf_counter() - started)
+
+    def add_time(self, package: str, phase: str, seconds: float):
+        """Adds time spent on a phase of a package, see [Profiler.time]"""
+
+        if self.path is None:
+            return
+
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+            if package is not None:
+                timings = self.packages.setdefault(_normalize_name(package), {})
+                timings[phase] = timings.get(phase, 0.0) + seconds
+
+    def count(self, counter: str, amount: int = 1):
+        """Adds to a counter of the report, e.g. `cache_hits` or `bytes_fetched`"""
+
+        if self.path is None:
+            return
+
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def report(self, command: str) -> dict:
+        """Makes the json-serializable report of everything recorded so far"""
+
+        with self._lock:
+            return {
+                "command": command,
+                "total": time.perf_counter() - self._started,
+                "phases": dict(self.phases),
+                "counters": dict(self.counters),
+                "packages": {
+                    name: dict(timings, total=sum(timings.values()))
+                    for name, timings in sorted(self.packages.items())
+                },
+            }
+
+    def save(self, command: str):
+        """Writes the json report to the started path and prints a summary
+        table of the slowest packages, if started"""
+
+        if self.path is None:
+            return
+
+        report = self.report(command)
+
+        with open(self.path, "w+") as file:
+            json.dump(report, file, indent=2)
+
+        phases = sorted(report["phases"])
+        slowest = sorted(
+            report["packages"].items(), key=lambda item: item[1]["total"], reverse=True
+        )[:PROFILE_TOP]
+
+        print(f"Profiled '{command}' in {report['total']:.2f}s..")
+
+        for counter, amount in sorted(report["counters"].items()):
+            print(f"\t{counter}: {amount}")
+
+        print(
+            "\t" + "".join(f"{column:>14}" for column in ["package", *phases, "total"])
+        )
+
+        for name, timings in slowest:
+            print(
+                f"\t{name[:14]:>14}"
+                + "".join(f"{timings.get(phase, 0.0):>14.3f}" for phase in phases)
+                + f"{timings['total']:>14.3f}"
+            )
+
+        print(f"Saved profile report to '{self.path}'!")
+
+        self.stop()
+
+    def stop(self):
+        """Stops recording without saving, a daemon may profile another command
+        later so this is always done once a command finishes"""
+
+        self.path = None
+
+
+class MetadataCache:
+    """A persistent sqlite cache of pypi metadata at `path`, keyed per `index_url`.
+    Entries older than `ttl` seconds are revalidated and the least recently
+    used entries are evicted past `max_size` bytes"""
+
+    def __init__(
+        self,
+        path: Path = CACHE_PATH,
+        ttl: int = CACHE_TTL,
+        max_size: int = CACHE_MAX_SIZE,
+        index_url: str = PYPI_URL,
+    ):
+        import sqlite3
+
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.index_url = index_url
+
+        self._lock = threading.Lock()  # shared between resolver workers
+        self._used = {}  # key: last used time, written once flushed
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+            self._conn.execute("DROP TABLE IF EXISTS metadata")  # not keyed by index
+            self._conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metadata ( index_url text, key text, body blob, "
+            "etag text, last_modified text, fetched_at real, last_used real, size int, "
+            "PRIMARY KEY ( index_url, key ) )"
+        )
+        self._conn.commit()
+
+        # kept up to date on every insert and delete, so eviction only scans
+        # the table once the cache has grown past max_size
+        self._total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM metadata"
+        ).fetchone()[0]
+
+    def get(self, key: str) -> tuple:
+        """Gets a cached `(body, etag, last_modified, fetched_at)` tuple or None
+        if the key has never been cached"""
+
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM metadata "
+                "WHERE index_url=? AND key=?",
+                (self.index_url, key),
+            ).fetchone()
+
+            if found is not None:
+                self._used[key] = time.time()
+
+        return found
+
+    def is_fresh(self, key: str, fetched_at: float) -> bool:
+        """Checks if an entry fetched at `fetched_at` is still inside the ttl,
+        single releases (`package/version` keys) never change so are always fresh"""
+
+        return "/" in key or time.time() - fetched_at < self.ttl
+
+    def store(self, key: str, body: bytes, etag: str = None, last_modified: str = None):
+        """Stores a freshly fetched body alongside its validators then evicts
+        old entries if the cache has grown too large"""
+
+        now = time.time()
+
+        with self._lock:
+            replaced = self._conn.execute(
+                "SELECT size FROM metadata WHERE index_url=? AND key=?",
+                (self.index_url, key),
+            ).fetchone()
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ( ?, ?, ?, ?, ?, ?, ?, ? )",
+                (self.index_url, key, body, etag, last_modified, now, now, len(body)),
+            )
+            self._total_size += len(body) - (replaced[0] if replaced else 0)
+            self._used.pop(key, None)
+
+            if self._total_size > self.max_size:
+                self._evict()
+
+            self._conn.commit()
+
+    def revalidated(self, key: str):
+        """Marks an entry as fresh again after the server confirmed it unchanged"""
+
+        with self._lock:
+            self._conn.execute(
+                "UPDATE metadata SET fetched_at=? WHERE index_url=? AND key=?",
+                (time.time(), self.index_url, key),
+            )
+            self._conn.commit()
+
+    def flush(self):
+        """Writes when entries were last used in a single transaction, done
+        once a command ends instead of on every [MetadataCache.get]"""
+
+        with self._lock:
+            self._flush_used()
+            self._conn.commit()
+
+    def close(self):
+        """Flushes and closes the database, the cache can't be used after"""
+
+        with self._lock:
+            self._flush_used()
+            self._conn.commit()
+            self._conn.close()
+
+    def _flush_used(self):
+        """Writes pending last used times, must be called while holding the lock"""
+
+        self._conn.executemany(
+            "UPDATE metadata SET last_used=? WHERE index_url=? AND key=?",
+            [(used, self.index_url, key) for key, used in self._used.items()],
+        )
+        self._used = {}
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits max_size,
+        must be called while holding the lock"""
+
+        self._flush_used()  # so recently read entries are kept
+
+        for index_url, key, size in self._conn.execute(
+            "SELECT index_url, key, size FROM metadata ORDER BY last_used"
+        ).fetchall():
+            self._conn.execute(
+                "DELETE FROM metadata WHERE index_url=? AND key=?", (index_url, key)
+            )
+            self._total_size -= size
+
+            if self._total_size <= self.max_size:
+                break
+
+
+class WheelStore:
+    """A content-addressed store of downloaded packages shared by every venv,
+    each file is kept at `<path>/<sha256[:2]>/<sha256>/<filename>` and is only
+    verified once when downloaded"""
+
+    def __init__(self, path: Path = STORE_PATH):
+        self.path = path
+
+    def find(self, digest: str) -> Path:
+        """Gets the stored file of a sha256 digest or None if not downloaded"""
+
+        digest_dir = self.path / digest[:2] / digest
+
+        if digest_dir.exists():
+            for filename in os.listdir(digest_dir):
+                if not filename.startswith("."):  # skip partial downloads
+                    return digest_dir / filename
+
+        return None
+
+    def fetch_locked(
+        self,
+        lock_rows: list,
+        jobs: int = DEFAULT_JOBS,
+        offline: bool = False,
+        locked_files: dict = None,
+    ) -> list:
+        """Ensures every `(name, version, hash)` lockfile row is in the store and
+        returns their paths. `locked_files` is a dict of hash to
+        `(filename, url)`, any hash without one is looked up on pypi"""
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        locked_files = locked_files or {}
+        stored = {}
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            fetch_futures = {
+                executor.submit(
+                    self._fetch_row, row, offline, locked_files.get(row[2])
+                ): row
+                for row in lock_rows
+            }
+
+            for future in as_completed(fetch_futures):
+                name, version, made_hash = fetch_futures[future]
+
+                try:
+                    stored[made_hash], downloaded = future.result()
+                except Exception as err:
+                    failed.append(f"'{name}':{version} ({err})")
+                    continue
+
+                if downloaded:  # printed here so worker output never interleaves
+                    print(f"\tDownloaded '{stored[made_hash].name}'..")
+
+        _raise_failed(failed, "download", ExceptionBuildFailed)
+
+        return [stored[made_hash] for _, _, made_hash in lock_rows]
+
+    def link_into(self, links_dir: Path, stored_paths: list):
+        """Hardlinks stored files into a flat directory for `pip --find-links`,
+        copying instead if hardlinks aren't possible"""
+
+        for stored_path in stored_paths:
+            link_path = links_dir / stored_path.name
+
+            if link_path.exists():
+                continue  # same file used twice
+
+            try:
+                os.link(stored_path, link_path)
+            except OSError:
+                shutil.copy2(stored_path, link_path)
+
+    def _fetch_row(self, row: tuple, offline: bool, locked_file: tuple) -> tuple:
+        """Gets the stored path of a single lockfile row, downloading if needed,
+        as a tuple alongside if it was downloaded"""
+
+        name, version, made_hash = row
+        found = self.find(made_hash)
+
+        if found is not None:
+            _get_profiler().count("store_hits")
+            return (found, False)
+
+        if locked_file is None:
+            artifact = _find_artifact(name, version, made_hash, offline)
+            locked_file = (
+                artifact["filename"],
+                urljoin(f"{PYPI_URL}/{name}/json", artifact["url"]),  # may be relative
+            )
+
+        if offline:
+            raise ExceptionOfflineCacheMiss(
+                f"The file '{locked_file[0]}' has not been downloaded so cannot be used offline!"
+            )
+
+        with _get_profiler().time(name, "download"):
+            return (self._download(locked_file[1], locked_file[0], made_hash), True)
+
+    def _download(self, url: str, filename: str, digest: str) -> Path:
+        """Downloads a file into the store, verifying its sha256 digest before it
+        is moved into place"""
+
+        digest_dir = self.path / digest[:2] / digest
+        digest_dir.mkdir(parents=True, exist_ok=True)
+
+        sha256 = hashlib.sha256()
+        partial_path = digest_dir / f".{filename}.{threading.get_ident()}"
+
+        with _get_http_session().get(url, stream=True) as resp:
+            if resp.status_code != 200:
+                raise ExceptionApiDown(
+                    f"Downloading '{filename}' has failed with error #{resp.status_code}!"
+                )
+
+            with open(partial_path, "wb") as file:
+                for data in resp.iter_content(BUF_SIZE):
+                    sha256.update(data)
+                    file.write(data)
+
+        _get_profiler().count("store_misses")
+        _get_profiler().count("bytes_downloaded", os.path.getsize(partial_path))
+
+        if sha256.hexdigest() != digest:
+            _del_path(partial_path)
+
+            raise ExceptionCorruptPackage(
+                f"Downloaded '{filename}' doesn't match its locked hash and may be corrupt/tampered!"
+            )
+
+        os.replace(partial_path, digest_dir / filename)
+
+        return digest_dir / filename
+
+
+class LockfileWriter:
+    """The single writer of a new lockfile, worker threads `put` rows onto a
+    queue drained in batches of `batch_size`. The lockfile only replaces
+    lock_path once closed, see `rows_written` and `content_hash`"""
+
+    def __init__(self, lock_path: Path, batch_size: int = LOCK_BATCH_SIZE):
+        import queue
+
+        self.lock_path = lock_path
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.artifacts_written = 0
+        self.edges_written = 0
+        self.elapsed = 0.0
+        self.content_hash = ""
+
+        self._temp_path = lock_path.with_name(f".{lock_path.name}.tmp")
+        self._queue = queue.Queue()
+        self._error = None
+        self._started = time.perf_counter()
+
+        _del_path(self._temp_path)  # leftover from a crashed lock
+
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def put(self, row: tuple):
+        """Queues a `(name, version, requirement, is_dev, is_dep, artifacts)` row
+        to be written where artifacts are `(filename, url, packagetype, digest)`
+        tuples, safe to use from any thread"""
+
+        self._queue.put(row)
+
+    def close(self, edges: list):
+        """Writes `(parent name, child name)` dependency edges once all rows are
+        drained, commits and replaces the lockfile"""
+
+        self._queue.put(("edges", edges))
+        self._queue.put(None)
+        self._thread.join()
+
+        if self._error is not None:
+            _del_path(self._temp_path)
+            raise self._error
+
+        os.replace(self._temp_path, self.lock_path)
+
+        self.elapsed = time.perf_counter() - self._started
+
+    def abort(self):
+        """Stops writing and discards the new lockfile, keeping the old one"""
+
+        self._queue.put(None)
+        self._thread.join()
+
+        _del_path(self._temp_path)
+
+    def _drain(self):
+        """Drains the queue on the writer thread, must only be ran by it"""
+
+        conn, c = _new_lockfile_connection(self._temp_path)
+
+        try:
+            c.execute("PRAGMA journal_mode = WAL")
+
+            for statement in LOCKFILE_SCHEMA:
+                c.execute(statement)
+
+            c.execute(
+                f"PRAGMA user_version = {OWPM_LOCKFILE_VERSION}"
+            )  # add mark of compatibility
+
+            while True:
+                batch = [self._queue.get()]
+
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get())
+
+                rows = [row for row in batch if row is not None and row[0] != "edges"]
+                self._write_rows(c, rows)
+
+                for item in batch:
+                    if item is not None and item[0] == "edges":
+                        self._write_edges(c, item[1])
+
+                if None in batch:
+                    break
+
+            self.content_hash = _lock_content_hash(c)
+            c.execute(
+                "INSERT INTO meta VALUES ( 'content_hash', ? )", (self.content_hash,)
+            )
+
+            conn.commit()
+        except Exception as err:
+            self._error = err
+        finally:
+            conn.close()
+
+    def _write_rows(self, c: sqlite3.Cursor, rows: list):
+        """Writes a batch of package rows alongside their artifacts, the time
+        taken is split evenly between the rows when profiling"""
+
+        started = time.perf_counter()
+
+        c.executemany(
+            "INSERT INTO package ( name, version, requirement, is_dev, is_dep ) "
+            "VALUES ( ?, ?, ?, ?, ? ) ON CONFLICT ( name, version ) DO UPDATE SET "
+            "is_dev = MIN(is_dev, excluded.is_dev), is_dep = MIN(is_dep, excluded.is_dep)",
+            [
+                (name, version, requirement, int(is_dev), int(is_dep))
+                for name, version, requirement, is_dev, is_dep, _ in rows
+            ],
+        )  # same package may be both a normal and development package
+        c.executemany(
+            "INSERT OR IGNORE INTO artifact ( package_id, filename, url, packagetype, "
+            "digest ) SELECT id, ?, ?, ?, ? FROM package WHERE name=? AND version=?",
+            [(*artifact, row[0], row[1]) for row in rows for artifact in row[5]],
+        )  # digest already locked, no need to add twice
+
+        self.rows_written += len(rows)
+        self.artifacts_written += sum(len(row[5]) for row in rows)
+
+        row_time = (time.perf_counter() - started) / max(len(rows), 1)
+
+        for row in rows:
+            _get_profiler().add_time(row[0], "db_write", row_time)
+
+    def _write_edges(self, c: sqlite3.Cursor, edges: list):
+        """Writes all dependency edges between already written packages"""
+
+        package_ids = dict(c.execute("SELECT name, id FROM package").fetchall())
+        edge_ids = [
+            (package_ids[parent], package_ids[child])
+            for parent, child in edges
+            if parent in package_ids and child in package_ids
+        ]
+
+        c.executemany("INSERT OR IGNORE INTO dependency VALUES ( ?, ? )", edge_ids)
+
+        self.edges_written += len(edge_ids)
+
+
 class OwpmVenv:
     """A built virtual enviroment created from a valid [Project]. If no venv_pin
     is given, it will generate a new one automatically"""
@@ -118,9 +747,254 @@ class OwpmVenv:
     def create_venv(self):
         """Creates venv"""
 
+        from venv import EnvBuilder
+
         EnvBuilder(system_site_packages=True).create(self.path)
         self.is_active = True
 
+    def install_locked(self, lock_rows: list, find_links: Path = None):
+        """Installs all `(name, version, hash)` rows with one hash-checked pip
+        call, retrying each alone only to find which failed. `find_links`
+        installs from that directory, using pypi only to build sdists"""
+
+        if len(lock_rows) == 0:
+            return
+
+        with _get_profiler().time(None, "pip_install"):
+            if self._pip_install(lock_rows, find_links) == 0:
+                return
+
+        for name, version, made_hash in lock_rows:
+            print(f"\tRetrying '{name}':{version} alone..")
+
+            with _get_profiler().time(name, "pip_install"):
+                exit_code = self._pip_install([(name, version, made_hash)], find_links)
+
+            if exit_code != 0:
+                raise ExceptionBuildFailed(
+                    f"Package '{name}':{version} could not be installed by pip, see its output above"
+                )
+
+    def _pip_install(self, lock_rows: list, find_links: Path = None) -> int:
+        """Installs lockfile rows with a single pip call, returning its exit code"""
+
+        import subprocess
+
+        _write_requirements(TEMP_REQUIRE, lock_rows)
+
+        command_to_call = [
+            f"{self.path}/bin/python",
+            "-m",
+            "pip",
+            "install",
+            "--no-deps",
+            "--require-hashes",
+            "-r",
+            TEMP_REQUIRE,
+        ]
+
+        if find_links is not None:
+            command_to_call.extend(["--find-links", str(find_links)])
+
+            if all(path.endswith(".whl") for path in os.listdir(find_links)):
+                command_to_call.append("--no-index")  # sdists need build deps
+
+        return subprocess.call(command_to_call, stdout=subprocess.DEVNULL)
+
+    def install_wheels(self, wheel_paths: list, jobs: int = DEFAULT_JOBS):
+        """Installs already hash-verified wheel files natively by unpacking
+        `jobs` of them at once into this venv, writing their RECORD, INSTALLER
+        and console scripts like pip would. Dependencies aren't installed"""
+
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        scheme = self._get_scheme()
+        failed = []
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            install_futures = {
+                executor.submit(self._install_wheel, wheel_path, scheme): wheel_path
+                for wheel_path in wheel_paths
+            }
+
+            for future in as_completed(install_futures):
+                try:
+                    future.result()
+                except Exception as err:
+                    failed.append(f"'{install_futures[future].name}' ({err})")
+
+        _raise_failed(failed, "install", ExceptionBuildFailed)
+
+    def _install_wheel(self, wheel_path: Path, scheme: dict):
+        """Unpacks a single wheel into the scheme paths of this venv"""
+
+        import base64
+        import configparser
+        import zipfile
+
+        with _get_profiler().time(wheel_path.name.split("-")[0], "install"):
+            with zipfile.ZipFile(wheel_path) as wheel:
+                names = wheel.namelist()
+                dist_info = next(
+                    name.split("/")[0]
+                    for name in names
+                    if name.split("/")[0].endswith(".dist-info")
+                )
+                data_dir = f"{dist_info[: -len('.dist-info')]}.data/"
+                wheel_info = wheel.read(f"{dist_info}/WHEEL").decode().lower()
+                purelib = "root-is-purelib: true" in wheel_info
+                root = scheme["purelib" if purelib else "platlib"]
+                python_path = f"{self.path}/bin/python"
+                record = []
+
+                for name in names:
+                    if name.endswith("/") or name == f"{dist_info}/RECORD":
+                        continue
+                    elif name.startswith(data_dir):
+                        kind, _, inner = name[len(data_dir) :].partition("/")
+                        target = scheme[kind] / inner
+                    else:
+                        target = root / name
+
+                    if ".." in Path(name).parts or Path(name).is_absolute():
+                        raise ExceptionCorruptPackage(
+                            f"Wheel '{wheel_path.name}' has unsafe path '{name}'!"
+                        )
+
+                    content = wheel.read(name)
+
+                    if name.startswith(f"{data_dir}scripts/") and content.startswith(
+                        b"#!python"
+                    ):
+                        content = b"#!" + python_path.encode() + content[8:]
+
+                    self._write_installed(target, content, name.startswith(data_dir))
+                    record.append((target, content))
+
+                entry_points = configparser.ConfigParser(
+                    delimiters=("=",), interpolation=None
+                )
+                entry_points.optionxform = str  # script names are case sensitive
+
+                if f"{dist_info}/entry_points.txt" in names:
+                    entry_points.read_string(
+                        wheel.read(f"{dist_info}/entry_points.txt").decode()
+                    )
+
+            for section in ("console_scripts", "gui_scripts"):
+                if not entry_points.has_section(section):
+                    continue
+
+                for script_name, entry_point in entry_points.items(section):
+                    content = _entry_point_script(python_path, entry_point)
+                    target = scheme["scripts"] / script_name
+
+                    self._write_installed(target, content, True)
+                    record.append((target, content))
+
+            installer_path = root / dist_info / "INSTALLER"
+            self._write_installed(installer_path, b"owpm\n", False)
+            record.append((installer_path, b"owpm\n"))
+
+            record_path = root / dist_info / "RECORD"
+            lines = []
+
+            for target, content in record:
+                digest = base64.urlsafe_b64encode(hashlib.sha256(content).digest())
+                lines.append(
+                    f"{os.path.relpath(target, root)},"
+                    f"sha256={digest.rstrip(b'=').decode()},{len(content)}"
+                )
+
+            lines.append(f"{os.path.relpath(record_path, root)},,")
+            record_content = ("\n".join(lines) + "\n").encode()
+            self._write_installed(record_path, record_content, False)
+
+    def _write_installed(self, target: Path, content: bytes, executable: bool):
+        """Writes a single installed file, replacing any file already there"""
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _del_path(target)  # may be hardlinked from a cloned venv
+
+        with open(target, "wb") as file:
+            file.write(content)
+
+        if executable:
+            os.chmod(target, 0o755)
+
+    def _get_scheme(self) -> dict:
+        """Gets the install paths of this venv by wheel .data directory name"""
+
+        import sysconfig
+
+        paths = sysconfig.get_paths(
+            vars={"base": str(self.path), "platbase": str(self.path)}
+        )
+
+        return {
+            "purelib": Path(paths["purelib"]),
+            "platlib": Path(paths["platlib"]),
+            "scripts": Path(paths["scripts"]),
+            "data": Path(paths["data"]),
+            "headers": Path(paths["include"]),
+        }
+
+    def clone_venv(self, base_venv):
+        """Creates this venv as a clone of the packages from another [OwpmVenv],
+        files are reflinked where the filesystem supports it, otherwise hardlinked
+        so the clone takes almost no extra disk space"""
+
+        self.create_venv()
+
+        base_site = base_venv._get_site_packages()
+        new_site = self._get_site_packages()
+
+        for root, dirs, files in os.walk(base_site):
+            new_root = new_site / os.path.relpath(root, base_site)
+
+            for dir_name in dirs:
+                (new_root / dir_name).mkdir(exist_ok=True)
+
+            for file in files:
+                if not (new_root / file).exists():
+                    _clone_file(Path(root) / file, new_root / file)
+
+        base_bin = base_venv.path / "bin"
+        base_path = str(base_venv.path).encode()
+
+        for file in os.listdir(base_bin):  # console scripts point to the base venv
+            new_file = self.path / "bin" / file
+
+            if new_file.exists() or os.path.islink(base_bin / file):
+                continue
+
+            with open(base_bin / file, "rb") as script:
+                content = script.read().replace(base_path, str(self.path).encode())
+
+            with open(new_file, "wb") as script:
+                script.write(content)
+
+            shutil.copymode(base_bin / file, new_file)
+
+    def uninstall(self, names: list):
+        """Uninstalls packages by name using pip"""
+
+        import subprocess
+
+        if len(names) == 0:
+            return
+
+        command_to_call = [
+            f"{self.path}/bin/python",
+            "-m",
+            "pip",
+            "uninstall",
+            "--yes",
+            *names,
+        ]
+
+        subprocess.call(command_to_call, stdout=subprocess.DEVNULL)
+
     def delete(self):
         """Deletes venv if active"""
 
@@ -135,6 +1009,8 @@ class OwpmVenv:
     def spawn_shell(self, args: list):
         """Creates an interactive shell and injects command base into"""
 
+        import pexpect
+
         if not self.path.exists():
             raise ExceptionVenvNotFound(f"{self} not found!")
 
@@ -171,6 +1047,8 @@ class OwpmVenv:
     def _get_spawn_os(self) -> tuple:
         """Returns tuple about os-specific actions related to self.spawn_shell"""
 
+        import shellingham
+
         try:
             found_shell = shellingham.detect_shell()
         except shellingham.ShellDetectionFailure:
@@ -195,6 +1073,17 @@ class OwpmVenv:
             [int(i) for i in os.popen("stty size", "r").read().split()]
         )  # apologies for spaghetti
 
+    def _get_site_packages(self) -> Path:
+        """Gets the site-packages path of this venv"""
+
+        import sysconfig
+
+        return Path(
+            sysconfig.get_path(
+                "purelib", vars={"base": str(self.path), "platbase": str(self.path)}
+            )
+        )
+
     def _get_path(self, pin: int) -> Path:
         """Makes a venv path from a specified PIN"""
 
@@ -210,29 +1099,198 @@ class OwpmVenv:
                 return venv_pin
 
 
-class Project:
-    """The overall project file. Name is the save name and lockfile_hash is for stopping mutliple locks on add -> install"""
+class VenvCache:
+    """The cache of built venv pins at TOML_PATH keyed by lockfile hash, build
+    kind and python, built from lockfiles kept in VENV_LOCKS_PATH. Least recently
+    used venvs, by directory mtime, are deleted past `budget` bytes"""
 
-    def __init__(
-        self,
-        name: str,
-        desc: str = "No description",
-        version: str = "0.1.0",
-        lockfile_hash: str = "",
-    ):
-        self.name = name
-        self.desc = desc
-        self.version = version
-        self.lockfile_hash = lockfile_hash
-        self.packages = []
+    def __init__(self, budget: int = VENV_CACHE_BUDGET):
+        self.budget = budget
+        self.entries = _get_venv_status().get("pins", {})  # old formats are dropped
+        self.python = f"{sys.implementation.name}-{platform.python_version()}"
 
-    def __repr__(self):
-        return f"<name:'{self.name}', desc:'{self.desc}', version:{self.version}, packages:{len(self.packages)}>"
+    def make_key(self, lockfile_hash: str, use_dev_deps: bool) -> str:
+        """Makes the key of a venv built from a lockfile for this python"""
+
+        build_type = "publish" if use_dev_deps else "dev"
+
+        return f"{lockfile_hash}-{build_type}-{self.python}"
+
+    def get(self, cache_key: str) -> OwpmVenv:
+        """Gets a cached venv and marks it as used or None if not cached or
+        if it has been deleted since"""
+
+        if cache_key not in self.entries:
+            return None
+
+        venv = OwpmVenv(self.entries[cache_key])
+
+        if not venv.is_active:
+            del self.entries[cache_key]  # venv may have been manually deleted
+            self.save()
+
+            return None
+
+        os.utime(venv.path)  # marks as used without saving every entry again
+
+        return venv
+
+    def lock_rows(self, cache_key: str) -> list:
+        """Gets the `(name, version, hash)` lockfile rows a cached venv was built
+        from using the lockfile of its hash, or None if it is missing"""
+
+        lockfile_hash, build_type, _ = cache_key.split("-", 2)
+        lock_path = VENV_LOCKS_PATH / f"{lockfile_hash}.owpmlock"
+
+        if not lock_path.exists():
+            return None
+
+        return [row[:3] for row in _lock_artifacts(lock_path, build_type == "publish")]
+
+    def closest(self, lock_rows: list) -> str:
+        """Gets the key of the cached venv for this python sharing the most
+        packages with the given lockfile rows, or None if no venv shares any"""
+
+        wanted_hashes = {made_hash for _, _, made_hash in lock_rows}
+        closest_key = None
+        closest_shared = 0
+
+        for cache_key, pin in self.entries.items():
+            if cache_key.split("-", 2)[2] != self.python:
+                continue  # can't clone a venv of another implementation/version
+
+            base_rows = self.lock_rows(cache_key) or []
+            shared = len(wanted_hashes.intersection(row[2] for row in base_rows))
+
+            if shared > closest_shared and OwpmVenv(pin).is_active:
+                closest_key = cache_key
+                closest_shared = shared
+
+        return closest_key
+
+    def put(self, cache_key: str, venv: OwpmVenv, lock_path: Path):
+        """Adds a newly built venv and a copy of the lockfile it was built from to
+        the cache then evicts old venvs if the cache is over budget"""
+
+        kept_path = VENV_LOCKS_PATH / f"{cache_key.split('-')[0]}.owpmlock"
+
+        if not kept_path.exists():
+            VENV_LOCKS_PATH.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(lock_path, kept_path)
+
+        self.entries[cache_key] = venv.pin
+
+        self._evict(cache_key)
+        self.save()
+
+    def remove(self, cache_key: str):
+        """Deletes a cached venv and removes it from the cache, doesn't save"""
+
+        pin = self.entries.pop(cache_key)
+        lockfile_hash = cache_key.split("-")[0]
+
+        try:
+            OwpmVenv(pin, True).delete()
+        except ExceptionVenvInactive:
+            pass  # venv may have been manually deleted
+
+        if not any(key.startswith(f"{lockfile_hash}-") for key in self.entries):
+            _del_path(VENV_LOCKS_PATH / f"{lockfile_hash}.owpmlock")
+
+    def save(self):
+        """Saves all cache entries to TOML_PATH"""
+
+        _set_venv_status({"pins": self.entries})
+
+    def _evict(self, keep_key: str):
+        """Deletes least recently used venvs apart from `keep_key` until the
+        cache fits in the budget"""
+
+        sizes = {
+            cache_key: _dir_size(VENV_PATH / str(pin))
+            for cache_key, pin in self.entries.items()
+        }
+        total_size = sum(sizes.values())
+
+        for cache_key in sorted(self.entries, key=self._last_used):
+            if total_size <= self.budget:
+                break
+            elif cache_key == keep_key:
+                continue
+
+            print(f"\tEvicting cached venv-{self.entries[cache_key]}..")
+
+            total_size -= sizes[cache_key]
+            self.remove(cache_key)
+
+    def _last_used(self, cache_key: str) -> float:
+        """Gets when a cached venv was last used, see [VenvCache.get]"""
+
+        try:
+            return os.stat(VENV_PATH / str(self.entries[cache_key])).st_mtime
+        except OSError:
+            return 0.0  # manually deleted, evict first
+
+
+class Project:
+    """The overall project file. Name is the save name and lockfile_hash is for stopping mutliple locks on add -> install.
+    Root is the directory the .owpm file and its lockfile are in"""
+
+    def __init__(
+        self,
+        name: str,
+        desc: str = "No description",
+        version: str = "0.1.0",
+        lockfile_hash: str = "",
+        root: Path = Path("."),
+    ):
+        self.name = name
+        self.desc = desc
+        self.version = version
+        self.lockfile_hash = lockfile_hash
+        self.root = root
+        self.packages = []
+        self._package_index = {}  # (normalized name, is_dev): [Package]
+
+    def __repr__(self):
+        return f"<name:'{self.name}', desc:'{self.desc}', version:{self.version}, packages:{len(self.packages)}>"
+
+    def add_package(self, package: Package):
+        """Adds a [Package] to the project, replacing any package with the same
+        normalized name and is_dev"""
+
+        package.key = (_normalize_name(package.name), package.is_dev)
+        replaced = self._package_index.get(package.key)
+
+        if replaced is not None:
+            self.packages.remove(replaced)  # replaced packages move to the end
+
+        self.packages.append(package)
+        self._package_index[package.key] = package
+
+    def find_package(self, name: str, is_dev: bool = False) -> Package:
+        """Gets the [Package] of a name as it was added to the project, or None"""
+
+        return self._package_index.get((_normalize_name(name), is_dev))
+
+    def drop_packages(self, to_drop: list):
+        """Drops a list of [Package] from the project without saving it"""
+
+        dropped = set(map(id, to_drop))
+        self.packages = [p for p in self.packages if id(p) not in dropped]
+
+        for package in to_drop:
+            if self._package_index.get(package.key) is package:
+                del self._package_index[package.key]
 
     def save_proj(self):
-        """Creates a human-readable and editable save file"""
+        """Creates a human-readable and editable save file, written atomically so
+        it is never left half-written. Dependencies found when locking aren't
+        saved"""
+
+        import toml
 
-        save_path = Path(f"{self.name}.owpm")
+        save_path = self.root / f"{self.name}.owpm"
 
         payload = {
             "desc": self.desc,
@@ -241,430 +1299,2172 @@ class Project:
             "packages": {},
         }
 
-        for package in self.packages:
-            if package.is_dev:
-                if "dev-packages" not in payload:
-                    payload["dev-packages"] = {}  # ensure optional is created
+        for package in self.packages:
+            if package.is_dep:
+                continue
+            elif package.key[1]:  # as added, locking may mark dev packages normal
+                if "dev-packages" not in payload:
+                    payload["dev-packages"] = {}  # ensure optional is created
+
+                payload["dev-packages"][package.name] = package.version_req
+            else:
+                payload["packages"][package.name] = package.version_req
+
+        _write_atomic(save_path, toml.dumps(payload).encode())
+        _write_project_cache(save_path, payload)
+
+    def lock_proj(
+        self,
+        force_lock: bool = False,
+        jobs: int = DEFAULT_JOBS,
+        offline: bool = False,
+        shared: SharedMetadata = None,
+    ) -> bool:
+        """Locks all packages and package deps then saves to .owpmlock path, unless
+        `force` still satisfying locked versions are kept. Returns True if
+        smart-locked, `shared` is given when locking a workspace"""
+
+        from concurrent.futures import as_completed
+
+        lock_path = self.root / f"{self.name}.owpmlock"
+        locked = {}
+
+        if not force_lock and lock_path.exists():
+            if self._compare_lock_hash(lock_path):
+                return True
+
+            locked = _read_locked_versions(lock_path)
+
+        resolver = Resolver(self, jobs, offline, locked, shared)
+        resolver.resolve()  # adds all deps of packages
+
+        writer = LockfileWriter(lock_path)
+        failed = []
+
+        with _pooled(None if shared is None else shared.executor, jobs) as executor:
+            lock_futures = {}
+
+            for package in self.packages:
+                print(f"\tLocking {package}..")
+
+                lock_futures[
+                    executor.submit(
+                        package._nthread_lock_package,
+                        writer,
+                        *resolver.release_for(package),
+                    )
+                ] = package
+
+            for future in as_completed(lock_futures):
+                try:
+                    future.result()
+                except Exception as err:
+                    failed.append(f"{lock_futures[future]} ({err})")
+
+        if failed:
+            writer.abort()
+            _raise_failed(failed, "lock")
+
+        writer.close(resolver.edge_names())
+
+        print(
+            f"\tWrote {writer.rows_written} package(s) and {writer.artifacts_written} "
+            f"file(s) to lockfile in {writer.elapsed:.2f}s.."
+        )
+
+        if writer.rows_written != len(self.packages):
+            raise ExceptionLockFailed(
+                f"Only {writer.rows_written} of {len(self.packages)} package(s) were written to the lockfile!"
+            )
+
+        self._update_lockfile_hash(lock_path)  # add new lockfile to x.owpm
+
+        return False
+
+    def build_proj(
+        self,
+        force_lock: bool = False,
+        use_dev_deps: bool = True,
+        jobs: int = DEFAULT_JOBS,
+        offline: bool = False,
+    ) -> OwpmVenv:
+        """Returns an installed venv or installs packages from lock_path, locks
+        if lockfile is out of date and adds to a new venv, which is then returned
+        for user to remember"""
+
+        import tempfile
+
+        lock_path = self.root / f"{self.name}.owpmlock"
+
+        self.lock_proj(force_lock, jobs, offline)  # ensure project is locked
+
+        venv_cache = VenvCache()
+        cache_key = venv_cache.make_key(self.lockfile_hash, use_dev_deps)
+        cached_venv = venv_cache.get(cache_key)
+
+        if cached_venv is not None:
+            return cached_venv
+
+        found_artifacts = _lock_artifacts(lock_path, use_dev_deps)
+        found_rows = [row[:3] for row in found_artifacts]
+        locked_files = {row[2]: row[3:] for row in found_artifacts if row[4]}
+
+        venv = OwpmVenv()
+        base_key = venv_cache.closest(found_rows)
+
+        if base_key is None:
+            venv.create_venv()
+            to_install = found_rows
+        else:
+            base_pin = venv_cache.entries[base_key]
+            print(f"\tCloning venv-{base_pin}..")
+
+            venv.clone_venv(OwpmVenv(base_pin))
+            to_install, to_remove = _diff_lock_rows(
+                venv_cache.lock_rows(base_key), found_rows
+            )
+
+            print(f"\tRemoving {len(to_remove)} changed package(s)..")
+            venv.uninstall(to_remove)
+
+        store = WheelStore()
+        stored_paths = store.fetch_locked(to_install, jobs, offline, locked_files)
+
+        print(f"\tInstalling {len(to_install)} package(s)..")
+
+        if INSTALLER == "native":  # pip is only needed to build sdists
+            wheel_paths = [path for path in stored_paths if path.suffix == ".whl"]
+            venv.install_wheels(wheel_paths, jobs)
+
+            to_install, stored_paths = _without_wheels(to_install, stored_paths)
+
+        if to_install:
+            STORE_PATH.mkdir(parents=True, exist_ok=True)
+
+            with tempfile.TemporaryDirectory(dir=STORE_PATH) as links_dir:
+                store.link_into(Path(links_dir), stored_paths)
+                venv.install_locked(to_install, Path(links_dir))
+
+        # caching mechanism so build_proj can skip installs if exactly the same
+        venv_cache.put(cache_key, venv, lock_path)
+
+        return venv
+
+    def remove_packages(self, to_remove: list):
+        """Removes a list of [Package] from .owpm"""
+
+        for package in to_remove:
+            if type(package) != Package:
+                raise Exception(
+                    f"Trying to remove '{package}' from db which is not a [Package]!"
+                )
+
+            print(f"\tRemoving {package}")
+
+        self.drop_packages(to_remove)
+
+        self.lockfile_hash = ""  # ensure lock
+        self.save_proj()
+
+    def _compare_lock_hash(self, lock_path: Path) -> bool:
+        """Compares self.lockfile_hash with a newly generated hash from the actual lockfile"""
+
+        return self._hash_lockfile(lock_path) == self.lockfile_hash
+
+    def _hash_lockfile(self, lock_path: Path) -> str:
+        """Gets the content hash of a lockfile, only computed for lockfiles
+        written before it was stored inside of them. Cached alongside the
+        parsed project until the lockfile changes"""
+
+        import sqlite3
+
+        save_path = self.root / f"{self.name}.owpm"
+
+        try:
+            lock_stat = os.stat(lock_path)
+        except FileNotFoundError:
+            return ""
+
+        lock_state = (lock_stat.st_mtime_ns, lock_stat.st_size)
+        cached = _read_project_cache(save_path)
+
+        if cached is not None and cached.get("lock", (None,))[:2] == lock_state:
+            return cached["lock"][2]
+
+        try:
+            conn, c = _open_lockfile(lock_path)
+        except (ExceptionOldLockfileSpec, sqlite3.DatabaseError):
+            return ""  # unreadable lockfiles never match
+
+        try:
+            lock_hash = _read_content_hash(c)
+        finally:
+            conn.close()
+
+        if cached is not None:
+            cached["lock"] = (*lock_state, lock_hash)
+            _write_project_cache(save_path, cached["payload"], cached)
+
+        return lock_hash
+
+    def _update_lockfile_hash(self, lock_path: Path):
+        """Updates lockfile hash and saves it to a .owpm file"""
+
+        self.lockfile_hash = self._hash_lockfile(lock_path)
+        self.save_proj()
+
+
+class Package:
+    """A single package when using owpm, is_dev defines if it is a development
+    package and should_rem_hash is internal use on loading from .owpm files.
+    Slotted as thousands may be made when resolving a project"""
+
+    __slots__ = ("name", "version_req", "parent_proj", "is_dev", "is_dep", "key")
+
+    def __init__(
+        self,
+        parent_proj: Project,
+        name: str,
+        version_req: str = "*",
+        is_dev: bool = False,
+        is_dep: bool = False,
+        should_rem_hash: bool = True,
+    ):
+        self.name = name
+        self.version_req = version_req
+        self.parent_proj = parent_proj
+        self.is_dev = is_dev
+        self.is_dep = is_dep
+
+        self.parent_proj.add_package(self)
+
+        if should_rem_hash:
+            self.parent_proj.lockfile_hash = ""  # ensure locks
+
+    def __repr__(self):
+        if (
+            self.version_req == "*" or not self.is_dep
+        ):  # latest version set/defined package
+            repr_version = self.version_req
+        else:  # if it is using pypi requirements
+            from packaging.requirements import Requirement
+
+            repr_version = str(Requirement(self.version_req).specifier) or "*"
+
+        return f"'{self.name}':{repr_version}"
+
+    def select_version(self, resp_json: dict = None) -> str:
+        """Picks the highest version satisfying self.version_req from the
+        releases of a pypi project json, pre-releases are only used if no final
+        release satisfies. Exactly pinned versions don't need resp_json"""
+
+        from packaging.version import InvalidVersion, parse as pkg_parse
+
+        specifier = _version_specifier(self.version_req)
+        pinned = _pinned_version(specifier)
+
+        if pinned is not None:
+            return pinned
+
+        candidates = {}  # parsed version: version string used by pypi
+
+        for version_string, content_body in resp_json["releases"].items():
+            if len(content_body) == 0 or all(
+                content.get("yanked", False) for content in content_body
+            ):
+                continue  # release has no usable content
+
+            try:
+                candidates[pkg_parse(version_string)] = version_string
+            except InvalidVersion:
+                continue  # legacy versions can't be compared
+
+        ordered = sorted(candidates, reverse=True)
+
+        for prereleases in (False, True):
+            for parsed_version in specifier.filter(ordered, prereleases=prereleases):
+                return candidates[parsed_version]  # highest due to sorting
+
+        raise ExceptionVersionError(
+            f"Package {self} with this specific version could not be found in pypi!"
+        )  # if no candidate matches
+
+    def get_artifacts(self, resp_json: dict) -> list:
+        """Gets the pypi file info of every file to lock from a release's json so
+        any interpreter can pick its wheel, yanked files are left out unless
+        the whole release was. resp_json is from `_pypi_req("name/version")`"""
+
+        if len(resp_json["urls"]) == 0:
+            raise ExceptionVersionError(
+                f"Package {self} has been created too recently for pypi to compute!"
+            )
+
+        return [
+            artifact
+            for artifact in resp_json["urls"]
+            if not artifact.get("yanked", False)
+        ] or resp_json["urls"]
+
+    def _nthread_lock_package(
+        self, writer: LockfileWriter, version: str, resp_json: dict
+    ) -> tuple:
+        """Designed for a multi-threaded locking system to lock a single package
+        from the already fetched pypi json of its selected version, the lockfile
+        row is given to the single lockfile writer and returned"""
+
+        json_url = f"{PYPI_URL}/{self.name}/json"
+
+        locked_artifacts = [
+            (
+                artifact["filename"],
+                urljoin(json_url, artifact["url"]),  # may be relative
+                artifact.get("packagetype"),
+                artifact["digests"]["sha256"],
+            )
+            for artifact in self.get_artifacts(resp_json)
+        ]
+
+        row = (
+            self.name,
+            version,
+            self.version_req,
+            self.is_dev,
+            self.is_dep,
+            locked_artifacts,
+        )
+        writer.put(row)
+
+        return row
+
+
+class Resolver:
+    """Resolves every dependency of a [Project] breadth-first using `jobs`
+    workers, fetching through `shared` if given. `offline` only uses cached
+    metadata and still satisfying `locked` versions are kept"""
+
+    def __init__(
+        self,
+        proj: Project,
+        jobs: int = DEFAULT_JOBS,
+        offline: bool = False,
+        locked: dict = None,
+        shared: SharedMetadata = None,
+    ):
+        from packaging.markers import default_environment
+
+        self.proj = proj
+        self.jobs = jobs
+        self.offline = offline
+        self.locked = locked or {}
+        self.shared = shared
+        self.nodes = {}  # normalized name: [Package]
+        self.extras = {}  # normalized name: set of requested extras
+        self.edges = {}  # normalized name: set of normalized child names
+        self.projects = {}  # normalized name: pypi project json
+        self.versions = {}  # normalized name: selected version
+        self.metadata = {}  # normalized name: pypi json of selected version
+        self.environment = default_environment()
+
+    def resolve(self):
+        """Resolves all packages of the project, adding any found dependencies
+        to it as new [Package] with is_dep set"""
+
+        level = []
+
+        for package in self.proj.packages.copy():
+            key = _normalize_name(package.name)
+
+            if key in self.nodes:
+                continue  # same package given twice, first one wins
+
+            self.nodes[key] = package
+            self.extras[key] = set()
+            self.edges[key] = set()
+
+            level.append(key)
+
+        while level:
+            level = self._resolve_level(level)
+
+        self._prune()
+
+    def edge_names(self) -> list:
+        """Gets all dependency edges of the resolved graph as a list of
+        `(parent name, child name)` tuples"""
+
+        return [
+            (self.nodes[key].name, self.nodes[child_key].name)
+            for key, child_keys in self.edges.items()
+            for child_key in child_keys
+        ]
+
+    def release_for(self, package) -> tuple:
+        """Gets the selected version and its fetched pypi json of a resolved
+        [Package] as a tuple"""
+
+        key = _normalize_name(package.name)
+
+        return (self.versions[key], self.metadata[key])
+
+    def _resolve_level(self, level: list) -> list:
+        """Fetches metadata for a level of the graph at once, returning the new
+        nodes of the next level. Project json only selects a version, the
+        rest comes from the much smaller release json"""
+
+        for key in level:
+            self.versions.pop(key, None)  # may be resolved again after narrowing
+            self.metadata.pop(key, None)
+            self.edges[key] = set()  # old children may not be needed anymore
+
+            specifier = _version_specifier(self.nodes[key].version_req)
+            locked_version = self.locked.get(key)
+
+            if locked_version is not None and specifier.contains(
+                locked_version, prereleases=True
+            ):
+                print(f"\tKeeping locked {self.nodes[key]}..")
+                self.versions[key] = locked_version
+            else:
+                print(f"\tPulling deps for {self.nodes[key]}..")
+
+        needs_project = [
+            key
+            for key in level
+            if key not in self.versions
+            and key not in self.projects
+            and _pinned_version(_version_specifier(self.nodes[key].version_req))
+            is None
+        ]
+
+        self._fetch_into(
+            self.projects, {key: self.nodes[key].name for key in needs_project}
+        )
+
+        failed = []
+
+        for key in level:
+            if key in self.versions:
+                continue  # kept from the lockfile
+
+            try:
+                with _get_profiler().time(key, "select"):
+                    self.versions[key] = self.nodes[key].select_version(
+                        self.projects.get(key)
+                    )
+            except ExceptionVersionError as err:
+                failed.append(f"{self.nodes[key]} ({err})")
+
+        _raise_failed(failed, "resolve")
+
+        self._fetch_into(
+            self.metadata,
+            {key: f"{self.nodes[key].name}/{self.versions[key]}" for key in level},
+            (ExceptionPackageNotFound, ExceptionOfflineCacheMiss),
+        )
+
+        no_release_api = [key for key in level if key not in self.metadata]
+
+        if no_release_api:  # some indexes only serve whole projects, or not cached
+            self._fetch_into(
+                self.projects,
+                {
+                    key: self.nodes[key].name
+                    for key in no_release_api
+                    if key not in self.projects
+                },
+            )
+
+            for key in no_release_api:
+                try:
+                    self.metadata[key] = _release_from_project(
+                        self.projects[key], self.versions[key]
+                    )
+                except ExceptionVersionError as err:
+                    failed.append(f"{self.nodes[key]} ({err})")
+
+            _raise_failed(failed, "resolve")
+
+        next_level = []
+
+        for key in level:
+            next_level.extend(self._expand(key, self.extras[key] or {""}))
+
+        return next_level
+
+    def _fetch_into(self, found: dict, to_fetch: dict, skip_error: type = ()):
+        """Fetches pypi json for a dict of node to pypi path concurrently and
+        saves them into `found` by node, nodes raising `skip_error` are left out"""
+
+        if not to_fetch:
+            return
+
+        if self.shared is None:
+            fetched = _pypi_req_many(list(to_fetch.values()), self.offline, self.jobs)
+        else:
+            fetched = self.shared.fetch_many(
+                list(to_fetch.values()), self.offline, self.jobs
+            )
+
+        failed = []
+
+        for key, pypi_path in to_fetch.items():
+            if isinstance(fetched[pypi_path], skip_error):
+                continue
+            elif isinstance(fetched[pypi_path], Exception):
+                failed.append(f"{self.nodes[key]} ({fetched[pypi_path]})")
+            else:
+                found[key] = fetched[pypi_path]
+
+        _raise_failed(failed, "resolve")
+
+    def _expand(self, key: str, extras: set) -> list:
+        """Adds requirements of an already fetched node that apply to the given
+        extras, returning any nodes which have not been seen before"""
+
+        from packaging.requirements import Requirement
+
+        parent = self.nodes[key]
+        required = self.metadata[key]["info"]["requires_dist"]
+        new_nodes = []
+
+        if not required:  # API gives NoneType sometimes
+            return new_nodes
+
+        for requirement_string in required:
+            requirement = Requirement(requirement_string)
+
+            if requirement.marker is not None and not any(
+                requirement.marker.evaluate(dict(self.environment, extra=extra))
+                for extra in extras
+            ):
+                continue  # not needed for this enviroment or these extras
+
+            child_key = _normalize_name(requirement.name)
+            self.edges[key].add(child_key)
+
+            if child_key not in self.nodes:
+                self.extras[child_key] = set(requirement.extras)
+                self.edges[child_key] = set()
+
+                requirement.marker = None
+                requirement.extras = set()
+
+                # make new packages into parent [Project] using same is_dev as parent
+                self.nodes[child_key] = Package(
+                    self.proj, requirement.name, str(requirement), parent.is_dev, True
+                )
+
+                new_nodes.append(child_key)
+                continue
+
+            child = self.nodes[child_key]
+
+            if child.is_dep:
+                if self._intersect(child, requirement.specifier):
+                    new_nodes.append(child_key)  # selected version no longer fits
+            elif not requirement.specifier.contains(
+                self.versions[child_key], prereleases=True
+            ):
+                raise ExceptionLockFailed(
+                    f"{parent} requires '{requirement}' but {child} was selected as "
+                    f"{self.versions[child_key]}, change the requirement of '{child.name}'!"
+                )  # top-level requirements are the user's, so never narrowed
+
+            new_extras = set(requirement.extras) - self.extras[child_key]
+
+            if new_extras:
+                self.extras[child_key] |= new_extras
+
+                if child_key in self.metadata:  # already expanded, so expand extras
+                    new_nodes.extend(self._expand(child_key, new_extras))
+
+        return new_nodes
+
+    def _intersect(self, package, specifier: SpecifierSet) -> bool:
+        """Narrows the requirement of a dependency [Package] to also satisfy
+        the given specifier, returns True if its selected version no longer
+        satisfies and so needs to be resolved again"""
+
+        from packaging.requirements import Requirement
+
+        requirement = Requirement(package.version_req)
+        requirement.specifier &= specifier
+
+        package.version_req = str(requirement)
+
+        version = self.versions.get(_normalize_name(package.name))
+
+        return version is not None and not requirement.specifier.contains(
+            version, prereleases=True
+        )
+
+    def _prune(self):
+        """Removes nodes no longer reached from a top-level package after a
+        narrowed node was resolved again. A node is only a development package
+        if no normal top-level package reaches it"""
+
+        normal_roots = []
+        roots = []
+
+        for key, package in self.nodes.items():
+            if not package.is_dep:
+                roots.append(key)
+
+                if not package.key[1]:  # as added by the user
+                    normal_roots.append(key)
+
+        reached = self._reach(roots)
+        reached_normal = self._reach(normal_roots)
+
+        dropped = []
+
+        for key in list(self.nodes):
+            package = self.nodes[key]
+
+            if key not in reached:
+                print(f"\tDropping unused {package}..")
+                dropped.append(package)
+
+                for found in (
+                    self.nodes,
+                    self.extras,
+                    self.edges,
+                    self.versions,
+                    self.metadata,
+                ):
+                    found.pop(key, None)
+            else:
+                package.is_dev = key not in reached_normal
+
+        self.proj.drop_packages(dropped)
+
+    def _reach(self, keys: list) -> set:
+        """Gets every node reachable from the given nodes, including themselves"""
+
+        reached = set(keys)
+        to_visit = list(keys)
+
+        while to_visit:
+            for child_key in self.edges[to_visit.pop()]:
+                if child_key not in reached:
+                    reached.add(child_key)
+                    to_visit.append(child_key)
+
+        return reached
+
+
+class SharedMetadata:
+    """Pypi json shared by many [Resolver] locking a workspace, so each path is
+    only fetched once. Every project is fetched and locked by the same
+    `executor` of `jobs` workers"""
+
+    def __init__(self, jobs: int = DEFAULT_JOBS):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.found = {}  # pypi path: Future of its json or exception
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Waits for and shuts down the shared executor"""
+
+        self.executor.shutdown()
+
+    def fetch_many(
+        self, pypi_paths: list, offline: bool = False, jobs: int = DEFAULT_JOBS
+    ) -> dict:
+        """Gets the json of many pypi paths like [_pypi_req_many], only fetching
+        the ones no other resolver has"""
+
+        from concurrent.futures import Future
+
+        to_fetch = []
+
+        with self._lock:
+            for pypi_path in pypi_paths:
+                if pypi_path not in self.found:
+                    self.found[pypi_path] = Future()
+                    to_fetch.append(pypi_path)
+
+        if to_fetch:
+            try:
+                fetched = _pypi_req_many(to_fetch, offline, jobs, self.executor)
+            except Exception as err:
+                for pypi_path in to_fetch:
+                    self.found[pypi_path].set_exception(err)  # don't leave waiters
+
+                raise
+
+            for pypi_path in to_fetch:
+                self.found[pypi_path].set_result(fetched[pypi_path])
+
+        return {pypi_path: self.found[pypi_path].result() for pypi_path in pypi_paths}
+
+
+class DependencyGraph:
+    """The dependency edges of a lockfile loaded once from an open lockfile
+    cursor into forward and reverse adjacency indexes keyed by normalized name,
+    so reverse-dependency, path and subtree queries never touch the lockfile"""
+
+    def __init__(self, c: sqlite3.Cursor):
+        self.packages = {}  # normalized name: (name, version, is_dev, is_dep)
+        self.children = {}  # normalized name: sorted normalized child names
+        self.parents = {}  # normalized name: sorted normalized parent names
+
+        keys = {}  # package id: normalized name
+
+        for package_id, name, version, is_dev, is_dep in c.execute(
+            "SELECT id, name, version, is_dev, is_dep FROM package ORDER BY name"
+        ):
+            key = _normalize_name(name)
+            keys[package_id] = key
+            self.packages[key] = (name, version, is_dev, is_dep)
+            self.children[key] = []
+            self.parents[key] = []
+
+        for parent_id, child_id in c.execute(
+            "SELECT parent_id, child_id FROM dependency"
+        ):
+            self.children[keys[parent_id]].append(keys[child_id])
+            self.parents[keys[child_id]].append(keys[parent_id])
+
+        for adjacency in (self.children, self.parents):
+            for names in adjacency.values():
+                names.sort()
+
+    def key(self, name: str) -> str:
+        """Gets the normalized name of a locked package, raising
+        [ExceptionPackageNotFound] if it isn't in the lockfile"""
+
+        key = _normalize_name(name)
+
+        if key not in self.packages:
+            raise ExceptionPackageNotFound(f"Package '{name}' is not in the lockfile")
+
+        return key
+
+    def roots(self) -> list:
+        """Gets the normalized names of all top-level packages, i.e. those which
+        are in the .owpm file rather than only pulled in as dependencies"""
+
+        return [key for key, row in self.packages.items() if not row[3]]
+
+    def subtree(self, name: str) -> set:
+        """Gets a package and every package it depends on, directly or not"""
+
+        return self._walk(self.children, self.key(name))
+
+    def dependants(self, name: str) -> set:
+        """Gets a package and every package which depends on it, directly or
+        not, which answers why a package is in the lockfile"""
+
+        return self._walk(self.parents, self.key(name))
+
+    def path(self, target: str, source: str = None) -> list:
+        """Gets the shortest list of normalized names going from `source` down
+        to `target`, from any top-level package if no source is given. Returns
+        an empty list if target can't be reached"""
+
+        target = self.key(target)
+        sources = [self.key(source)] if source else self.roots()
+        came_from = {key: None for key in sources}
+        level = sources
+
+        while level and target not in came_from:
+            next_level = []
+
+            for key in level:
+                for child in self.children[key]:
+                    if child not in came_from:
+                        came_from[child] = key
+                        next_level.append(child)
+
+            level = next_level
+
+        if target not in came_from:
+            return []
+
+        found = []
+
+        while target is not None:
+            found.append(target)
+            target = came_from[target]
+
+        return found[::-1]
+
+    def to_dot(self, keys: set = None) -> str:
+        """Exports the graph, or just the given normalized names, as graphviz dot"""
+
+        keys = self.packages.keys() if keys is None else keys
+        lines = ["digraph owpm {"]
+
+        for key in sorted(keys):
+            name, version, is_dev, is_dep = self.packages[key]
+            style = "" if is_dep else ", style=bold"
+            lines.append(f'\t"{key}" [label="{name} {version}"{style}];')
+
+        for key in sorted(keys):
+            for child in self.children[key]:
+                if child in keys:
+                    lines.append(f'\t"{key}" -> "{child}";')
+
+        lines.append("}")
+
+        return "\n".join(lines)
+
+    def to_json(self, keys: set = None) -> str:
+        """Exports the graph, or just the given normalized names, as json"""
+
+        keys = self.packages.keys() if keys is None else keys
+        nodes = {}
+
+        for key in sorted(keys):
+            name, version, is_dev, is_dep = self.packages[key]
+            nodes[key] = {
+                "name": name,
+                "version": version,
+                "is_dev": bool(is_dev),
+                "is_dep": bool(is_dep),
+                "dependencies": [
+                    child for child in self.children[key] if child in keys
+                ],
+            }
+
+        return json.dumps(nodes, indent=2)
+
+    def _walk(self, adjacency: dict, start: str) -> set:
+        """Gets every normalized name reachable from start in an adjacency index"""
+
+        found = {start}
+        stack = [start]
+
+        while stack:
+            for next_key in adjacency[stack.pop()]:
+                if next_key not in found:
+                    found.add(next_key)
+                    stack.append(next_key)
+
+        return found
+
+
+class OwpmDaemon:
+    """A background owpm process serving cli commands over a unix socket at
+    `socket_path`, keeping caches warm between commands. Commands are ran one
+    at a time as they change directory and capture stdout"""
+
+    def __init__(self, socket_path: Path = DAEMON_SOCKET):
+        self.socket_path = socket_path
+        self.served = 0
+
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._server = None
+
+    def serve(self):
+        """Serves commands until stopped, blocking the calling thread"""
+
+        import socketserver
+
+        global _in_daemon
+
+        if _daemon_request({"action": "status"}, self.socket_path) is not None:
+            raise click.ClickException("A daemon is already serving this socket!")
+
+        _in_daemon = True
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                if daemon._is_owner(self.request):
+                    daemon._handle(self.rfile, self.wfile)
+
+        _del_path(self.socket_path)  # refused, left over from a killed daemon
+
+        old_umask = os.umask(0o077)  # only our user may connect
+
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(
+                str(self.socket_path), Handler
+            )
+        finally:
+            os.umask(old_umask)
+
+        self._server.daemon_threads = True
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            _del_path(self.socket_path)
+
+    def _is_owner(self, connection) -> bool:
+        """Checks a connection comes from our own user, where the platform
+        can tell through SO_PEERCRED"""
+
+        import socket
+        import struct
+
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True  # the socket's 0600 permissions still apply
+
+        creds = connection.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+        )
+        _, uid, _ = struct.unpack("3i", creds)
+
+        return uid == os.getuid()
+
+    def _handle(self, rfile, wfile):
+        """Handles a json request line, answering `{"out": text}` lines then a
+        final `{"exit": code}`. Commands with other OWPM_* enviroment variables
+        than the daemon's aren't ran, given as an exit code of None"""
+
+        request = json.loads(rfile.readline())
+        output = DaemonOutput(wfile)
+
+        if request.get("action") == "status":
+            uptime = time.time() - self._started
+            output.write(
+                f"Daemon is running as pid {os.getpid()} for {uptime:.0f}s, "
+                f"served {self.served} command(s)!\n"
+            )
+            exit_code = 0
+        elif request.get("action") == "stop":
+            output.write("Stopped daemon!\n")
+            threading.Thread(target=self._server.shutdown).start()
+            exit_code = 0
+        elif request.get("env") != _owpm_environ():
+            exit_code = None  # configured differently, client runs it instead
+        else:
+            exit_code = self._run_command(request["cwd"], request["args"], output)
+
+        output.finish(exit_code)
+
+    def _run_command(self, cwd: str, args: list, output: DaemonOutput) -> int:
+        """Runs cli args in cwd with stdout sent to output, returns the exit code"""
+
+        import traceback
+        from contextlib import redirect_stdout
+
+        with self._lock:
+            old_cwd = os.getcwd()
+            self.served += 1
+
+            try:
+                os.chdir(cwd)
+
+                with redirect_stdout(output):
+                    result = base_group.main(
+                        args=args, prog_name="owpm", standalone_mode=False
+                    )
+
+                return result if isinstance(result, int) else 0
+            except click.ClickException as err:
+                err.show(file=output)
+                return err.exit_code
+            except click.Abort:
+                return 1
+            except Exception:
+                output.write(traceback.format_exc())
+                return 1
+            finally:
+                _get_profiler().stop()  # never left started by a failed command
+                os.chdir(old_cwd)
+
+
+class DaemonOutput:
+    """A file-like object sending everything written to it to a daemon client"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text: str) -> int:
+        if text:
+            self._send({"out": text})
+
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def finish(self, exit_code: int):
+        """Sends the exit code, ending the response"""
+
+        self._send({"exit": exit_code})
+
+    def _send(self, message: dict):
+        try:
+            self.wfile.write(json.dumps(message).encode() + b"\n")
+            self.wfile.flush()
+        except OSError:
+            pass  # client went away, finish the command anyway
+
+
+class ThreadOutput:
+    """A file-like object keeping everything written by a thread inside
+    [ThreadOutput.capture] apart, so output of many threads doesn't mix.
+    Writes of any other thread go to `fallback`"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+        self._local = threading.local()
+
+    @contextmanager
+    def capture(self):
+        """Captures everything the calling thread writes, yielding the StringIO
+        it's written to"""
+
+        import io
+
+        self._local.buffer = io.StringIO()
+
+        try:
+            yield self._local.buffer
+        finally:
+            self._local.buffer = None
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, "buffer", None)
+
+        if buffer is None:
+            return self.fallback.write(text)
+
+        return buffer.write(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+
+def project_from_toml(owpm_path: Path) -> Project:
+    """Gets a [Project] from a given TOML path, using the parsed copy cached in
+    PROJECT_CACHE_PATH if the file hasn't changed since"""
+
+    cached = _read_project_cache(owpm_path)
+
+    if cached is not None:
+        payload = cached["payload"]
+    else:
+        import toml
+
+        with open(owpm_path, "r") as file:
+            payload = toml.load(file)
+
+        _write_project_cache(owpm_path, payload)
+
+    project = Project(
+        owpm_path.stem,
+        payload["desc"],
+        payload["version"],
+        payload["lockfile_hash"],
+        owpm_path.parent,
+    )
+
+    for package in payload["packages"]:
+        Package(project, package, payload["packages"][package], False, False, False)
+
+    # optional development packages
+    if "dev-packages" in payload:
+        for package in payload["dev-packages"]:
+            Package(
+                project, package, payload["dev-packages"][package], True, False, False
+            )
+
+    return project
+
+
+def first_project_indir() -> Project:
+    """Finds the first .owpm file in the running directory, or the closest
+    parent directory with one like git does, and returns [Project]"""
+
+    cwd = Path.cwd()
+
+    for directory in (cwd, *cwd.parents):
+        try:
+            owpm_files = sorted(
+                file for file in os.listdir(directory) if file.endswith(".owpm")
+            )
+        except OSError:
+            continue  # unreadable parent
+
+        if owpm_files:
+            return project_from_toml(directory / owpm_files[0])
+
+    raise ExceptionOwpmNotFound(
+        "An .owpm file was not found in the current path or any parent of it!"
+    )
+
+
+def _read_project_cache(owpm_path: Path) -> dict:
+    """Gets the cache entry of a parsed .owpm file as a dict with its toml
+    `payload` and maybe the `lock` state, None if missing or the file has
+    changed since it was cached"""
+
+    try:
+        owpm_stat = os.stat(owpm_path)
+    except OSError:
+        return None
+
+    cached = _load_project_cache(owpm_path)
+
+    if cached is None or cached.get("owpm") != (
+        owpm_stat.st_mtime_ns,
+        owpm_stat.st_size,
+    ):
+        return None
+
+    return cached
+
+
+def _write_project_cache(owpm_path: Path, payload: dict, cached: dict = None):
+    """Caches the toml payload of a .owpm file keyed by its path, mtime and size,
+    `cached` is an existing entry to update. Otherwise only the lock state of
+    the last entry is kept, as it is keyed by the lockfile instead"""
+
+    import marshal
+
+    if cached is None:
+        last_cached = _load_project_cache(owpm_path) or {}
+        cached = {"lock": last_cached["lock"]} if "lock" in last_cached else {}
+
+    owpm_stat = os.stat(owpm_path)
+    cached = dict(cached)
+    cached["owpm"] = (owpm_stat.st_mtime_ns, owpm_stat.st_size)
+    cached["payload"] = payload
+
+    try:
+        PROJECT_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+        _write_atomic(_project_cache_path(owpm_path), marshal.dumps(cached))
+    except (OSError, ValueError):
+        pass  # caching is only an optimisation
+
+
+def _load_project_cache(owpm_path: Path) -> dict:
+    """Loads the cache entry of a .owpm file without checking if it's still
+    valid, None if there isn't a readable one"""
+
+    import marshal
+
+    try:
+        with open(_project_cache_path(owpm_path), "rb") as file:
+            cached = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None  # not cached or made by another python version
+
+    return cached if isinstance(cached, dict) else None
+
+
+def _project_cache_path(owpm_path: Path) -> Path:
+    """Makes the cache path of a .owpm file from a hash of its full path"""
+
+    path_hash = hashlib.sha256(str(owpm_path.resolve()).encode()).hexdigest()
+
+    return PROJECT_CACHE_PATH / f"{path_hash[:32]}.marshal"
+
+
+def _write_atomic(file_path: Path, content: bytes):
+    """Writes a file through a temporary file next to it which then replaces
+    it, so it is never left half-written"""
+
+    temp_path = file_path.with_name(f".{file_path.name}.{threading.get_ident()}.tmp")
+
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(content)
+
+        os.replace(temp_path, file_path)
+    finally:
+        _del_path(temp_path)
+
+
+def projects_in_tree(root: Path) -> list:
+    """Finds every .owpm file under a directory as a [Project], skipping
+    hidden directories and owpm's own venvs and store"""
+
+    skipped = {VENV_PATH.name, STORE_PATH.name, "__pycache__", "node_modules"}
+    found = []
+
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(
+            dir_name
+            for dir_name in dir_names
+            if not dir_name.startswith(".") and dir_name not in skipped
+        )
+
+        for file_name in sorted(file_names):
+            if file_name.endswith(".owpm"):
+                found.append(project_from_toml(Path(dir_path) / file_name))
+
+    return found
+
+
+def _normalize_name(name: str) -> str:
+    """Normalizes a package name like pypi does (pep 503), used for every name
+    lookup as it doesn't need packaging imported"""
+
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _del_path(file_path: Path):
+    """Deletes given file path if it exists"""
+
+    if file_path.exists():
+        os.remove(file_path)
+
+
+def _verify_lockfile_version(user_version: int) -> bool:
+    """Verifies lockfile using local tally of user_version to ensure compatibility"""
+
+    if user_version != OWPM_LOCKFILE_VERSION:  # NOTE: could be not hardcoded in future
+        raise ExceptionOldLockfileSpec(
+            "The .owpmlock version/specification is too new or old for owpm to recognise!"
+        )
+
+
+def _version_specifier(version_req: str) -> SpecifierSet:
+    """Makes a specifier from any version requirement used by [Package], be it
+    `*`, a bare version from `owpm add x==1.0`, a specifier or a full pypi
+    requirement"""
+
+    from packaging.requirements import Requirement
+    from packaging.specifiers import SpecifierSet
+    from packaging.version import InvalidVersion, parse as pkg_parse
+
+    version_req = version_req.strip()
+
+    if version_req in ("", "*"):
+        return SpecifierSet()
+    elif version_req[0] in "<>=!~":
+        return SpecifierSet(version_req)
+
+    try:
+        return SpecifierSet(f"=={pkg_parse(version_req)}")
+    except InvalidVersion:
+        return Requirement(version_req).specifier
+
+
+def _pinned_version(specifier: SpecifierSet) -> str:
+    """Gets the version of a specifier pinning a single exact version or None"""
+
+    if len(specifier) == 1:
+        only = next(iter(specifier))
+
+        if only.operator in ("==", "===") and not only.version.endswith("*"):
+            return only.version
+
+    return None
+
+
+def _release_from_project(project_json: dict, version: str) -> dict:
+    """Makes the json of a single release from a whole pypi project json, for
+    indexes without per-version json. Only the latest release can be made as
+    the project json only has its requirements"""
+
+    name = project_json["info"]["name"]
+
+    if version not in project_json["releases"]:
+        raise ExceptionVersionError(
+            f"Version {version} of '{name}' could not be found in pypi!"
+        )
+    elif version != project_json["info"]["version"]:
+        raise ExceptionVersionError(
+            f"Requirements of '{name}':{version} are unknown as its release json is not cached or served by pypi!"
+        )
+
+    return {"info": project_json["info"], "urls": project_json["releases"][version]}
+
+
+def _find_artifact(name: str, version: str, made_hash: str, offline: bool) -> dict:
+    """Finds the pypi file info (with `url` and `filename`) of a locked hash,
+    looking at the locked release first then every release of the package"""
+
+    try:
+        release_files = _pypi_req(f"{name}/{version}", offline)["urls"]
+    except (ExceptionPackageNotFound, ExceptionOfflineCacheMiss):
+        release_files = []  # index has no per-version json or not cached
+
+    for release_file in release_files:
+        if release_file["digests"]["sha256"] == made_hash:
+            return release_file
+
+    for release_files in _pypi_req(name, offline)["releases"].values():
+        for release_file in release_files:
+            if release_file["digests"]["sha256"] == made_hash:
+                return release_file
+
+    raise ExceptionPackageNotFound(
+        f"No file of '{name}':{version} with the locked hash was found in pypi!"
+    )
+
+
+def _lock_artifacts(lock_path: Path, use_dev_deps: bool) -> list:
+    """Gets the `(name, version, hash, filename, url)` rows of the artifacts to
+    install from a lockfile, see [_select_artifacts]"""
+
+    conn, c = _open_lockfile(lock_path)  # ensure lockfile is to owpm's spec
+
+    select_query = (
+        "SELECT package.name, package.version, artifact.digest, artifact.filename, "
+        "artifact.url FROM package JOIN artifact ON artifact.package_id = package.id"
+    )
+
+    if use_dev_deps:
+        select_query += " WHERE package.is_dev=0"
+
+    found_artifacts = c.execute(select_query).fetchall()
+    conn.close()
+
+    return _select_artifacts(found_artifacts)
+
+
+def _select_artifacts(found_artifacts: list) -> list:
+    """Picks the best artifact of each package from `(name, version, digest,
+    filename, url)` lockfile rows using [_best_artifact], keeping the order
+    packages were found in"""
+
+    by_package = {}
+
+    for row in found_artifacts:
+        by_package.setdefault((row[0], row[1]), []).append(row)
+
+    selected = []
+    failed = []
+
+    for (name, version), rows in by_package.items():
+        best = _best_artifact([row[3] for row in rows])
+
+        if best is None:
+            failed.append(f"'{name}':{version} (no compatible files)")
+        else:
+            selected.append(rows[best])
+
+    _raise_failed(failed, "build", ExceptionBuildFailed)
+
+    return selected
+
+
+def _best_artifact(filenames: list) -> int:
+    """Gets the index of the best file to install on this platform, wheels are
+    ranked by their best tag and sdists come last. Returns None if only
+    incompatible wheels were given"""
+
+    from packaging.utils import InvalidWheelFilename, parse_wheel_filename
+
+    tag_priorities = _get_tag_priorities()
+    fallback = len(tag_priorities)  # sdists need building, so last resort
+    best = None
+    best_priority = None
+
+    for index, filename in enumerate(filenames):
+        if filename is None or not filename.endswith(".whl"):
+            priority = fallback
+        else:
+            try:
+                tags = parse_wheel_filename(filename)[3]
+            except InvalidWheelFilename:
+                continue
+
+            priority = min(
+                (tag_priorities[tag] for tag in tags if tag in tag_priorities),
+                default=None,
+            )
+
+            if priority is None:
+                continue  # built for another interpreter or platform
+
+        if best_priority is None or priority < best_priority:
+            best = index
+            best_priority = priority
+
+    return best
+
+
+_tag_priorities = None
+
+
+def _get_tag_priorities() -> dict:
+    """Gets the wheel tags supported by this interpreter as a dict of tag to
+    priority, lower is better"""
+
+    global _tag_priorities
+
+    if _tag_priorities is None:
+        from packaging.tags import sys_tags
+
+        _tag_priorities = {tag: priority for priority, tag in enumerate(sys_tags())}
+
+    return _tag_priorities
+
+
+def _raise_failed(failed: list, action: str, exception: type = ExceptionLockFailed):
+    """Raises a single exception listing all failed packages, [ExceptionLockFailed]
+    unless another is given"""
+
+    if failed:
+        raise exception(
+            f"Could not {action} {len(failed)} package(s): {', '.join(failed)}"
+        )
+
+
+def _read_locked_versions(lock_path: Path) -> dict:
+    """Reads every locked version of a lockfile as a dict of normalized name to
+    version, used to keep still satisfying versions when locking again"""
+
+    import sqlite3
+    from packaging.version import InvalidVersion, parse as pkg_parse
+
+    try:
+        conn, c = _open_lockfile(lock_path)
+        locked_rows = c.execute("SELECT name, version FROM package").fetchall()
+        conn.close()
+    except (ExceptionOldLockfileSpec, sqlite3.DatabaseError):
+        locked_rows = []  # unreadable lockfiles are simply fully locked again
+
+    locked = {}
+
+    for name, version in locked_rows:
+        try:
+            locked[_normalize_name(name)] = str(pkg_parse(version))
+        except InvalidVersion:
+            continue  # migrated lockfiles may not have versions
+
+    return locked
+
+
+def _print_lock_rows(c: sqlite3.Cursor) -> int:
+    """Streams every locked package of an open lockfile to stdout, ordered by
+    kind using the package_filter index, returning the amount printed"""
+
+    kinds = {
+        (0, 0): "",
+        (1, 0): " (dev)",
+        (0, 1): " (dep)",
+        (1, 1): " (dev dep)",
+    }
+    found = 0
+
+    for name, version, is_dev, is_dep in c.execute(
+        "SELECT name, version, is_dev, is_dep FROM package "
+        "ORDER BY is_dev, is_dep, name"
+    ):
+        print(f"\t'{name}':{version}{kinds[(is_dev, is_dep)]}")
+        found += 1
+
+    return found
+
+
+_dependency_graphs = {}  # lockfile path: ((mtime, size), [DependencyGraph])
+
+
+def _load_dependency_graph(lock_path: Path, c: sqlite3.Cursor) -> DependencyGraph:
+    """Gets the [DependencyGraph] of an open lockfile, reusing the last one
+    loaded from the same unchanged lockfile (e.g. when running as a daemon)"""
+
+    lock_stat = os.stat(lock_path)
+    lock_key = str(lock_path.resolve())
+    version = (lock_stat.st_mtime_ns, lock_stat.st_size)
+
+    found = _dependency_graphs.get(lock_key)
+
+    if found is None or found[0] != version:
+        found = (version, DependencyGraph(c))
+        _dependency_graphs[lock_key] = found
+
+    return found[1]
+
+
+def _print_lock_tree(graph: DependencyGraph) -> int:
+    """Prints a [DependencyGraph] as a tree under each top-level package,
+    dependencies seen before are not expanded again. Returns the amount of
+    unique packages printed"""
+
+    seen = set()
+
+    for root in graph.roots():
+        name, version, is_dev = graph.packages[root][:3]
+        dev_note = " (dev)" if is_dev else ""
+        print(f"\t'{name}':{version}{dev_note}")
+        seen.add(root)
+
+        stack = [(child, 2) for child in reversed(graph.children[root])]
+
+        while stack:
+            key, depth = stack.pop()
+            name, version = graph.packages[key][:2]
+            indent = "\t" * depth
+
+            if key in seen:
+                print(f"{indent}'{name}':{version} (*)")
+                continue
+
+            print(f"{indent}'{name}':{version}")
+            seen.add(key)
+
+            stack.extend((child, depth + 1) for child in reversed(graph.children[key]))
+
+    return len(seen)
+
+
+def _open_lockfile(lock_path: Path) -> tuple:
+    """Opens a connection to a lockfile, ensuring it is to owpm's spec. Lockfiles
+    from older specifications are migrated in an in-memory copy, so reading
+    never changes them and they're only replaced once locked again"""
+
+    import sqlite3
+
+    conn, c = _new_lockfile_connection(lock_path)
+
+    user_version = c.execute("PRAGMA user_version").fetchall()[0][0]
+
+    if user_version == 1:
+        memory_conn = sqlite3.connect(":memory:")
+        conn.backup(memory_conn)
+        conn.close()
+
+        conn, c = (memory_conn, memory_conn.cursor())
+        _migrate_lockfile_v1(conn, c)
+    else:
+        _verify_lockfile_version(user_version)
+
+    return (conn, c)
+
+
+def _read_content_hash(c: sqlite3.Cursor) -> str:
+    """Reads the stored content hash of an open lockfile, computing it if the
+    lockfile was written without one"""
+
+    import sqlite3
+
+    try:
+        found = c.execute("SELECT value FROM meta WHERE key='content_hash'").fetchone()
+    except sqlite3.OperationalError:
+        found = None  # no meta table
+
+    if found is None:
+        return _lock_content_hash(c)
+
+    return found[0]
+
+
+def _lock_content_hash(c: sqlite3.Cursor) -> str:
+    """Hashes the sorted rows of an open lockfile, so the same lock always has
+    the same hash no matter the order it was written in or the machine"""
+
+    packages = c.execute(
+        "SELECT name, version, requirement, is_dev, is_dep FROM package "
+        "ORDER BY name, version"
+    ).fetchall()
+    artifacts = c.execute(
+        "SELECT package.name, package.version, artifact.digest FROM artifact "
+        "JOIN package ON package.id = artifact.package_id ORDER BY artifact.digest"
+    ).fetchall()
+    edges = c.execute(
+        "SELECT parent.name, child.name FROM dependency "
+        "JOIN package AS parent ON parent.id = dependency.parent_id "
+        "JOIN package AS child ON child.id = dependency.child_id "
+        "ORDER BY parent.name, child.name"
+    ).fetchall()
+
+    payload = json.dumps([packages, artifacts, edges], separators=(",", ":"))
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _migrate_lockfile_v1(conn: sqlite3.Connection, c: sqlite3.Cursor):
+    """Migrates a version 1 lockfile to the current specification in a single
+    transaction, requirements stored instead of a version are kept as the
+    requirement with an empty version"""
+
+    from packaging.version import InvalidVersion, parse as pkg_parse
+
+    print("\tMigrating lockfile to a newer specification..")
+
+    old_rows = c.execute(
+        "SELECT name, version, hash, is_dev, is_dep FROM lock"
+    ).fetchall()
+
+    conn.isolation_level = None  # transaction is managed here, ddl included
+    c.execute("BEGIN IMMEDIATE")
+    c.execute("DROP TABLE lock")
+
+    for statement in LOCKFILE_SCHEMA:
+        c.execute(statement)
+
+    for name, version, made_hash, is_dev, is_dep in old_rows:
+        try:
+            requirement, version = (None, str(pkg_parse(version)))
+        except InvalidVersion:
+            requirement, version = (version, "")
+
+        c.execute(
+            "INSERT INTO package ( name, version, requirement, is_dev, is_dep ) "
+            "VALUES ( ?, ?, ?, ?, ? ) ON CONFLICT ( name, version ) DO UPDATE SET "
+            "is_dev = MIN(is_dev, excluded.is_dev), is_dep = MIN(is_dep, excluded.is_dep)",
+            (name, version, requirement, is_dev, is_dep),
+        )  # v1 could lock the same package multiple times
+        c.execute(
+            "INSERT OR IGNORE INTO artifact ( package_id, digest ) SELECT id, ? "
+            "FROM package WHERE name=? AND version=?",
+            (made_hash, name, version),
+        )
+
+    c.execute(
+        "INSERT INTO meta VALUES ( 'content_hash', ? )", (_lock_content_hash(c),)
+    )
+    c.execute(f"PRAGMA user_version = {OWPM_LOCKFILE_VERSION}")
+    c.execute("COMMIT")
+
+
+def _write_requirements(require_path: Path, lock_rows: list):
+    """Writes `(name, version, hash)` lockfile rows as a fully hashed pip
+    requirements file, every hash of a package goes onto the same line"""
+
+    from packaging.version import InvalidVersion, parse as pkg_parse
+
+    requirements = {}  # requirement: list of hashes
+
+    for name, version, made_hash in lock_rows:
+        try:
+            requirement = f"{name}=={pkg_parse(version)}"
+        except InvalidVersion:
+            requirement = name  # older lockfiles stored requirements, not versions
+
+        requirements.setdefault(requirement, []).append(made_hash)
+
+    with open(require_path, "w+") as f_out:
+        for requirement, hashes in requirements.items():
+            hash_options = " ".join(f"--hash=sha256:{made_hash}" for made_hash in hashes)
+            f_out.write(f"{requirement} {hash_options}\n")
+
+
+def _new_lockfile_connection(lock_path: Path) -> tuple:
+    """Creates a new sqlite connection to a given lockfile"""
+
+    import sqlite3
+
+    conn = sqlite3.connect(str(lock_path))
+    c = conn.cursor()
+
+    return (conn, c)
+
+
+def _pypi_req(package: str, offline: bool = False) -> dict:
+    """Gets the decoded json of a fully-formed request to the PyPI API using a
+    given package name, served from the [MetadataCache] when fresh or still
+    valid. `offline` only ever uses the cache"""
+
+    cached, found = _pypi_cached(package, offline)
+
+    if found is not None:
+        return found
+
+    with _get_profiler().time(package.split("/")[0], "fetch"):
+        with _get_http_session().get(
+            f"{PYPI_URL}/{package}/json",
+            headers=_pypi_validators(cached),
+            stream=True,
+        ) as resp:
+            resp.raw.decode_content = True  # parsed straight from the socket
+
+            return _pypi_handle_resp(
+                package, cached, resp.status_code, resp.raw, resp.headers
+            )
+
+
+def _pypi_req_many(
+    packages: list,
+    offline: bool = False,
+    jobs: int = DEFAULT_JOBS,
+    executor: Executor = None,
+) -> dict:
+    """Gets the decoded json of many packages at once using the HTTP_BACKEND,
+    returning a dict of package name to json or the exception it raised.
+    Requests are made by `executor` if given, instead of a new pool"""
+
+    import asyncio
+    from concurrent.futures import as_completed
+
+    results = {}
+    to_fetch = []
+
+    for package in packages:
+        try:
+            cached, found = _pypi_cached(package, offline)
+        except Exception as err:
+            results[package] = err
+            continue
+
+        if found is not None:
+            results[package] = found
+        else:
+            to_fetch.append((package, cached))
+
+    if not to_fetch:
+        return results
+
+    if HTTP_BACKEND == "async" and _has_httpx():
+        results.update(asyncio.run(_pypi_req_async(to_fetch)))
+        return results
+
+    with _pooled(executor, min(jobs, POOL_SIZE)) as executor:
+        fetch_futures = {
+            executor.submit(_pypi_req, package, offline): package
+            for package, _ in to_fetch
+        }
+
+        for future in as_completed(fetch_futures):
+            try:
+                results[fetch_futures[future]] = future.result()
+            except Exception as err:
+                results[fetch_futures[future]] = err
+
+    return results
+
+
+async def _pypi_req_async(to_fetch: list) -> dict:
+    """Fetches `(package, cached)` pairs concurrently using an asyncio httpx
+    client, preferring http2 when the `h2` package is avaliable"""
+
+    import asyncio
+    import httpx
+
+    limits = httpx.Limits(max_connections=POOL_SIZE)
+
+    try:
+        client = httpx.AsyncClient(http2=True, limits=limits)
+    except ImportError:
+        client = httpx.AsyncClient(limits=limits)  # no h2, stick to http1.1
+
+    async def fetch(package: str, cached: tuple):
+        started = time.perf_counter()
+
+        for attempt in range(HTTP_RETRIES + 1):
+            resp = await client.get(
+                f"{PYPI_URL}/{package}/json", headers=_pypi_validators(cached)
+            )
+
+            if resp.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                break
+
+            await asyncio.sleep(HTTP_BACKOFF * (2 ** attempt))
+
+        _get_profiler().add_time(
+            package.split("/")[0], "fetch", time.perf_counter() - started
+        )
+
+        return _pypi_handle_resp(
+            package, cached, resp.status_code, resp.content, resp.headers
+        )
+
+    async with client:
+        fetched = await asyncio.gather(
+            *[fetch(package, cached) for package, cached in to_fetch],
+            return_exceptions=True,
+        )
 
-                payload["dev-packages"][package.name] = package.version_req
-            else:
-                payload["packages"][package.name] = package.version_req
+    return {package: found for (package, _), found in zip(to_fetch, fetched)}
 
-        with open(save_path, "w+") as file:
-            toml.dump(payload, file)
 
-    def lock_proj(self, force_lock: bool = False) -> bool:
-        """Locks all packages and package deps then saves to .owpmlock path;
-        `force` always locks, even if owpm thinks the packages are already locked.
-        Will return a False if it needed to lock or True if smart-locked"""
+def _pypi_cached(package: str, offline: bool) -> tuple:
+    """Looks up a package in the [MetadataCache], returns the raw cache entry
+    and the decoded json if it can be used without a request"""
 
-        lock_path = Path(f"{self.name}.owpmlock")
+    cached = _get_metadata_cache().get(package)
 
-        if not force_lock and lock_path.exists() and self._compare_lock_hash(lock_path):
-            return True
+    if cached is not None and (
+        offline or _get_metadata_cache().is_fresh(package, cached[3])
+    ):
+        _get_profiler().count("cache_hits")
+        return (cached, json.loads(cached[0]))
+    elif offline:
+        raise ExceptionOfflineCacheMiss(
+            f"The package '{package}' has not been cached so cannot be used offline!"
+        )
 
-        _del_path(lock_path)  # delete db
+    return (cached, None)
 
-        conn, c = _new_lockfile_connection(lock_path)
 
-        c.execute(
-            "CREATE TABLE lock ( name text, version text, hash text, is_dev int, is_dep int )"
-        )  # add main lock table
-        c.execute(
-            f"PRAGMA user_version = {OWPM_LOCKFILE_VERSION}"
-        )  # add mark of compatibility
+def _pypi_validators(cached: tuple) -> dict:
+    """Makes conditional request headers from a cache entry, if any"""
 
-        conn.commit()
-        conn.close()
+    headers = {}
 
-        # adds all deps of package
-        for package in self.packages.copy():  # NOTE: also thread this potentially?
-            package.get_subpackages()
+    if cached is not None:
+        if cached[1]:
+            headers["If-None-Match"] = cached[1]
+        if cached[2]:
+            headers["If-Modified-Since"] = cached[2]
 
-        # add to db loop around
-        for package in self.packages:
-            lock_thread = threading.Thread(
-                target=package._nthread_lock_package, args=(lock_path,)
-            )
-            lock_thread.start()
+    return headers
 
-        # TODO: fix race condition that worserns the more locks
-        race_conditon_workaround = len(self.packages) / 20
-        print(f"\tWaiting {race_conditon_workaround} second(s) for package lock..")
-        time.sleep(race_conditon_workaround)
 
-        self._update_lockfile_hash(lock_path)  # add new lockfile to x.owpm
+def _pypi_handle_resp(package: str, cached: tuple, status_code: int, content, headers):
+    """Turns a pypi response into its compact metadata record, updating the
+    [MetadataCache] or raising for failed requests. `content` is either the
+    body or a file-like object to read it from"""
 
-        return False
+    cache = _get_metadata_cache()
 
-    def build_proj(
-        self, force_lock: bool = False, use_dev_deps: bool = True
-    ) -> OwpmVenv:
-        """Returns an installed venv or installs packages from lock_path, locks
-        if lockfile is out of date and adds to a new venv, which is then returned
-        for user to remember"""
+    if status_code == 304 and cached is not None:
+        _get_profiler().count("cache_revalidated")
+        cache.revalidated(package)
+        return json.loads(cached[0])
+    elif status_code == 200:
+        found = _compact_metadata(content, int(headers.get("Content-Length") or 0))
+        fetched_size = len(content) if isinstance(content, bytes) else content.tell()
 
-        lock_path = Path(f"{self.name}.owpmlock")
+        _get_profiler().count("cache_misses")
+        _get_profiler().count("bytes_fetched", fetched_size)
+        cache.store(
+            package,
+            json.dumps(found, separators=(",", ":")).encode(),
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+        )
+        return found
+    elif status_code == 404:
+        raise ExceptionPackageNotFound(
+            f"The package '{package}' was not found in pypi!"
+        )
+    else:
+        raise ExceptionApiDown(
+            f"A seemingly valid API request to PyPI has failed with error #{status_code}!"
+        )
 
-        self.lock_proj(force_lock)  # ensure project is locked
 
-        venv_info = _get_venv_status()
+def _compact_metadata(content, size: int = 0) -> dict:
+    """Parses pypi project or release json into the compact record owpm uses,
+    keeping only `name`, `version`, `requires_dist` and files. Bodies of at
+    least STREAM_MIN_SIZE are streamed if ijson is installed"""
+
+    if size >= STREAM_MIN_SIZE and _has_ijson():
+        return _compact_metadata_stream(content)
+
+    if not isinstance(content, bytes):
+        content = content.read()
+
+    found = json.loads(content)
+    info = found["info"]
+    compact = {
+        "info": {
+            "name": info.get("name"),
+            "version": info.get("version"),
+            "requires_dist": info.get("requires_dist"),
+        },
+        "urls": [_compact_file(file_json) for file_json in found.get("urls", [])],
+    }
+
+    if "releases" in found:
+        compact["releases"] = {
+            version: [_compact_file(file_json) for file_json in files]
+            for version, files in found["releases"].items()
+        }
 
-        if venv_info:
-            venv_path = VENV_PATH / venv_info["pin"]
+    return compact
 
-            if (
-                venv_info["lockfile_hash"] != self.lockfile_hash
-            ):  # delete old venv that used to be new
-                old_venv = OwpmVenv(venv_info["pin"], True)
-                print(f"\tDeleting old {old_venv}..")
 
-                try:
-                    old_venv.delete()
-                except ExceptionVenvInactive:
-                    pass  # venv may have been manually deleted
-
-            if not venv_path.exists():
-                _set_venv_status({})  # set a new dict as venv is corrupt
-            elif (
-                venv_info["force_lock"] == force_lock
-                and venv_info["use_dev_deps"] == use_dev_deps
-                and venv_info["lockfile_hash"] == self.lockfile_hash
-            ):
-                return OwpmVenv(venv_info["pin"], True)
-        else:
-            _set_venv_status({})  # set a new dict
+def _compact_metadata_stream(content) -> dict:
+    """Streams the json of a pypi project or release into the compact record
+    of [_compact_metadata] using ijson parser events"""
 
-        venv = OwpmVenv()
-        venv.create_venv()
+    import ijson
 
-        conn, c = _new_lockfile_connection(lock_path)
+    compact = {"info": {"name": None, "version": None, "requires_dist": None}}
+    files_at = {"urls": compact.setdefault("urls", [])}  # json prefix: file list
+    file_prefix = None
+    file_json = None
 
-        _verify_lockfile_version(
-            c.execute("PRAGMA user_version").fetchall()[0][0]
-        )  # ensure lockfile is to owpm's spec
+    for prefix, event, value in ijson.parse(content):
+        if file_prefix is not None and prefix.startswith(file_prefix):
+            field = prefix[len(file_prefix) :]
 
-        if not use_dev_deps:
-            select_query = "SELECT * FROM lock WHERE is_dep=0"
-        else:
-            select_query = "SELECT * FROM lock WHERE is_dev=0 AND is_dep=0"
-
-        found_non_deps = c.execute(
-            select_query
-        ).fetchall()  # find all non-dep packages and filter for use_dev_deps
-
-        # install all non-dep packages
-        for non_dep in found_non_deps:
-            print(f"\tInstalling '{non_dep[0]}':{non_dep[1]}..")
-
-            with open(TEMP_REQUIRE, "w+") as f_out:
-                f_out.write(f"{non_dep[0]} --hash=sha256:{non_dep[2]}\n")
-
-            command_to_call = [
-                f"{venv.path}/bin/python",
-                "-m",
-                "pip",
-                "install",
-                "-r",
-                TEMP_REQUIRE,
-                "--require-hashes",
-            ]
-
-            cmd_out = subprocess.call(command_to_call, stdout=subprocess.DEVNULL)
-
-            if cmd_out != 0: # TODO: This will accidently flag errors that are just installation errors
-                raise ExceptionCorruptPackage(
-                    f"Package that was installing is corrupt/tampered! Please ensure your using stable & reliable internet then try again shortly."
-                )
+            if field in ("filename", "url", "packagetype", "yanked"):
+                file_json[field] = value
+            elif field == "digests.sha256":
+                file_json["digests"]["sha256"] = value
+        elif prefix in files_at and event == "start_array":
+            file_list = files_at[prefix]
+        elif prefix.endswith(".item") and prefix[:-5] in files_at:
+            if event == "start_map":
+                file_json = {"yanked": False, "digests": {}}
+                file_list.append(file_json)
+                file_prefix = f"{prefix}."
+            elif event == "end_map":
+                file_prefix = None
+        elif prefix == "releases" and event == "start_map":
+            compact["releases"] = {}
+        elif prefix == "releases" and event == "map_key":
+            files_at[f"releases.{value}"] = compact["releases"][value] = []
+        elif prefix in ("info.name", "info.version"):
+            compact["info"][prefix[5:]] = value
+        elif prefix == "info.requires_dist" and event == "start_array":
+            compact["info"]["requires_dist"] = []
+        elif prefix == "info.requires_dist.item":
+            compact["info"]["requires_dist"].append(value)
 
-        conn.close()
+    return compact
 
-        _set_venv_status(
-            {
-                "pin": venv.pin,
-                "lockfile_hash": self.lockfile_hash,
-                "force_lock": force_lock,
-                "use_dev_deps": use_dev_deps,
-            }
-        )  # caching mechanism so build_proj can skip installs if exactly the same
 
-        return venv
+def _compact_file(file_json: dict) -> dict:
+    """Gets only the parts of a pypi file's json used by owpm"""
 
-    def remove_packages(self, to_remove: list):
-        """Removes a list of [Package] from .owpm"""
+    return {
+        "filename": file_json.get("filename"),
+        "url": file_json.get("url"),
+        "packagetype": file_json.get("packagetype"),
+        "yanked": file_json.get("yanked", False),
+        "digests": {"sha256": file_json.get("digests", {}).get("sha256")},
+    }
 
-        for package in to_remove:
-            if type(package) != Package:
-                raise Exception(
-                    f"Trying to remove '{package}' from db which is not a [Package]!"
-                )
 
-            print(f"\tRemoving {package}")
+def _has_ijson() -> bool:
+    """Checks if the optional ijson package used for streaming json is installed"""
 
-            self.packages.remove(package)
+    from importlib.util import find_spec
 
-        self.lockfile_hash = ""  # ensure lock
-        self.save_proj()
+    return find_spec("ijson") is not None
 
-    def remove_cached_venv(self):
-        """Removes a cached venv from the venv cache status if existant. Ensure
-        this is used before wiping any lockfile hashes as it requires one to
-        identify itself."""
 
-        # TODO: restructure venv cache to allow multiple enviroments at once
+def _has_httpx() -> bool:
+    """Checks if the optional httpx package used for async requests is installed"""
 
-        venv_status = _get_venv_status()
+    from importlib.util import find_spec
 
-        if len(venv_status) != 0 and venv_status["lockfile_hash"] == self.lockfile_hash:
-            print("Removing cached virtual enviroment..")
+    return find_spec("httpx") is not None
 
-            rem_venv = OwpmVenv(venv_status["pin"], True)
-            rem_venv.delete()
 
-            _set_venv_status({})
+_http_session = None
+_http_session_lock = threading.Lock()
 
-    def _compare_lock_hash(self, lock_path: Path) -> bool:
-        """Compares self.lockfile_hash with a newly generated hash from the actual lockfile"""
 
-        return self._hash_lockfile(lock_path) == self.lockfile_hash
+def _get_http_session() -> requests.Session:
+    """Gets the shared pooled http session with retries, creating it on first use"""
 
-    def _hash_lockfile(self, lock_path: Path) -> str:
-        """Hashes a lockfile to use in comparisons or at end of locking"""
+    global _http_session
 
-        md5 = hashlib.md5()
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 
-        with open(lock_path, "rb") as file:
-            while True:
-                data = file.read(BUF_SIZE)
+    with _http_session_lock:
+        if _http_session is None:
+            retries = Retry(
+                total=HTTP_RETRIES,
+                backoff_factor=HTTP_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=["GET"],
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retries
+            )
 
-                if not data:
-                    break
+            _http_session = requests.Session()
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
 
-                md5.update(data)
+    return _http_session
 
-        return md5.hexdigest()
 
-    def _update_lockfile_hash(self, lock_path: Path):
-        """Updates lockfile hash and saves it to a .owpm file (doesn't save all
-        in self.packages)"""
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
 
-        save_path = Path(f"{self.name}.owpm")
+_profiler = Profiler()  # shared by every thread, started by cli commands
 
-        self.lockfile_hash = self._hash_lockfile(lock_path)
 
-        payload = toml.load(open(save_path, "r"))
-        payload["lockfile_hash"] = self.lockfile_hash
-        toml.dump(payload, open(save_path, "w+"))
+def _close_metadata_cache():
+    """Closes the shared [MetadataCache] if opened, it is opened again on next use"""
 
+    global _metadata_cache
 
-class Package:
-    """A single package when using owpm. `save_hash` is generated automatically
-    after locking once. should_rem_hash is internal use on loading from .owpm
-    files and is_dev defines if it is a development package or not"""
+    with _metadata_cache_lock:
+        if _metadata_cache is not None:
+            _metadata_cache.close()
+            _metadata_cache = None
 
-    def __init__(
-        self,
-        parent_proj: Project,
-        name: str,
-        version_req: str = "*",
-        is_dev: bool = False,
-        is_dep: bool = False,
-        should_rem_hash: bool = True,
-    ):
-        self.name = name
-        self.version_req = version_req
-        self.parent_proj = parent_proj
-        self.is_dev = is_dev
-        self.is_dep = is_dep
 
-        self.parent_proj.packages.append(self)
+def _flush_metadata_cache():
+    """Flushes the shared [MetadataCache] if opened, done once a command ends"""
 
-        if should_rem_hash:
-            self.parent_proj.lockfile_hash = ""  # ensure locks
+    with _metadata_cache_lock:
+        if _metadata_cache is not None:
+            _metadata_cache.flush()
 
-    def __repr__(self):
-        if (
-            self.version_req == "*" or not self.is_dep
-        ):  # latest version set/defined package
-            repr_version = self.version_req
-        else:  # if it is using pypi requirements
-            version_split = self.version_req.split(" ;")[0].split(" ")
 
-            if len(version_split) == 1:
-                repr_version = "*"
-            else:
-                repr_version = version_split[1][1:-1]
+def _get_metadata_cache() -> MetadataCache:
+    """Gets the shared [MetadataCache], opening it on first use"""
 
-        return f"'{self.name}':{repr_version}"
+    global _metadata_cache
 
-    def get_subpackages(self) -> str:
-        """Scans pypi for dependancies and adds them to [Project.package] as a
-        new [Package] and returns hash of this self"""
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = MetadataCache()
 
-        print(f"\tPulling deps for {self}..")
+    return _metadata_cache
 
-        resp = _pypi_req(self.name)
-        resp_json = resp.json()
 
-        required = resp_json["info"]["requires_dist"]
+def _get_profiler() -> Profiler:
+    """Gets the shared [Profiler], which only records once started"""
 
-        if required:  # API gives NoneType sometimes
-            for subpackage in required:
-                subpkg_name = subpackage.split(";")[0].split(" ")[0]
+    return _profiler
 
-                # make new packages into parent [Project] using same is_dev as self
-                Package(self.parent_proj, subpkg_name, subpackage, self.is_dev, True)
 
-        return self.get_hash(resp)
+@contextmanager
+def _pooled(executor: Executor, max_workers: int):
+    """Yields the given shared executor as is, or a new pool of max_workers
+    threads if None which is shut down once done"""
 
-    def get_hash(self, package_resp: requests.Response) -> str:
-        """Gets lock hash, package_resp is for modularity (use `_pypi_req("package")`)"""
+    from concurrent.futures import ThreadPoolExecutor
 
-        resp_json = package_resp.json()
+    if executor is not None:
+        yield executor
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            yield executor
 
-        if self.version_req == "*":
-            if len(resp_json["urls"]) == 0:
-                raise ExceptionVersionError(
-                    f"Package {self} has been created too recently for pypi to compute!"
-                )
 
-            return resp_json["urls"][0]["digests"]["sha256"]
+def _dir_size(path: Path) -> int:
+    """Gets the total size of all files inside of a directory in bytes, files
+    hardlinked from elsewhere only count their share of the size"""
 
-        version_requires = Requirement(self.version_req)
+    total_size = 0
 
-        for version_string in resp_json["releases"]:
-            parsed_version = pkg_parse(
-                version_string
-            )  # parse already-valid pypi into package.version.Version
+    for root, _, files in os.walk(path):
+        for file in files:
+            file_stat = os.lstat(os.path.join(root, file))
 
-            content_body = resp_json["releases"][version_string]
+            if not os.path.islink(os.path.join(root, file)):
+                total_size += file_stat.st_size // file_stat.st_nlink
 
-            # if parsed_version matches required
-            if parsed_version in version_requires.specifier and len(content_body) > 0:
-                # TODO: make sure that release even has content, if not install version before
-                return content_body[0]["digests"]["sha256"]
+    return total_size
 
-        raise ExceptionVersionError(
-            f"Package {self} with this specific version could not be found in pypi!"
-        )  # if package was not returned by for loop
 
-    def _nthread_lock_package(self, lock_path: Path):
-        """Designed for a multi-threaded locking system to add a single package"""
+def _clone_file(src: Path, dst: Path):
+    """Clones a file as a reflink if the filesystem supports it, otherwise as
+    a hardlink, only copying if neither is possible"""
 
-        print(f"\tLocking {self}..")
+    try:
+        import fcntl
 
-        conn, c = _new_lockfile_connection(lock_path)
+        with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
 
-        made_hash = self.get_hash(_pypi_req(self.name))
+        shutil.copystat(src, dst)
+        return
+    except (ImportError, OSError):
+        _del_path(dst)  # reflinks unsupported
 
-        if c.execute(f"SELECT * FROM lock WHERE hash='{made_hash}'").fetchall():
-            return  # hash already in lock, no need to add twicee
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
 
-        if self.is_dep:
-            c.execute(
-                "INSERT INTO lock VALUES ( ?, ?, ?, ?, 1 )",
-                (self.name, self.version_req, made_hash, self.is_dev),
-            )
-        else:
-            c.execute(
-                "INSERT INTO lock VALUES ( ?, ?, ?, ?, 0 )",
-                (self.name, self.version_req, made_hash, self.is_dev),
-            )
 
-        conn.commit()
-        conn.close()
+def _diff_lock_rows(base_rows: list, lock_rows: list) -> tuple:
+    """Compares the `(name, version, hash)` lockfile rows a venv was built from
+    to wanted rows, returns a tuple of rows to install and package names to
+    uninstall"""
 
+    base_hashes = {row[2] for row in base_rows}
+    wanted_hashes = {row[2] for row in lock_rows}
 
-def project_from_toml(owpm_path: Path) -> Project:
-    """Gets a [Project] from a given TOML path"""
+    to_install = [row for row in lock_rows if row[2] not in base_hashes]
+    to_remove = sorted({row[0] for row in base_rows if row[2] not in wanted_hashes})
 
-    payload = toml.load(open(owpm_path, "r"))
+    return (to_install, to_remove)
 
-    project = Project(
-        owpm_path.stem, payload["desc"], payload["version"], payload["lockfile_hash"]
-    )
 
-    for package in payload["packages"]:
-        new_package = Package(
-            project, package, payload["packages"][package], False, False, False
-        )
+def _entry_point_script(python_path: str, entry_point: str) -> bytes:
+    """Makes a console script launching a `module:attr [extras]` entry point
+    using the given python, in the same form as pip makes them"""
 
-    # optional development packages
-    if "dev-packages" in payload:
-        for package in payload["dev-packages"]:
-            new_package = Package(
-                project, package, payload["dev-packages"][package], True, False, False
-            )
+    module, _, attr = entry_point.split("[")[0].strip().partition(":")
+    import_name = attr.split(".")[0]
 
-    return project
+    return (
+        f"#!{python_path}\n"
+        "# -*- coding: utf-8 -*-\n"
+        "import re\n"
+        "import sys\n"
+        f"from {module.strip()} import {import_name.strip()}\n"
+        "if __name__ == '__main__':\n"
+        "    sys.argv[0] = re.sub(r'(-script\\.pyw|\\.exe)?$', '', sys.argv[0])\n"
+        f"    sys.exit({attr.strip()}())\n"
+    ).encode()
 
 
-def first_project_indir() -> Project:
-    """Finds first .owpm file in running directory and returns [Project]"""
+def _without_wheels(lock_rows: list, stored_paths: list) -> tuple:
+    """Filters wheels out of lockfile rows and their matching stored paths,
+    returning both lists of what's left"""
 
-    found = False
+    kept = [
+        (row, stored_path)
+        for row, stored_path in zip(lock_rows, stored_paths)
+        if stored_path.suffix != ".whl"
+    ]
 
-    for file in os.listdir("."):
-        if file.endswith(".owpm"):
-            found = True
-            return project_from_toml(Path(file))
+    return ([row for row, _ in kept], [stored_path for _, stored_path in kept])
 
-    if not found:
-        raise ExceptionOwpmNotFound("An .owpm file was not found in the current path!")
 
+_in_daemon = False  # set in the daemon process so commands aren't forwarded again
 
-def _del_path(file_path: Path):
-    """Deletes given file path if it exists"""
 
-    if file_path.exists():
-        os.remove(file_path)
+def _daemon_request(request: dict, socket_path: Path = DAEMON_SOCKET) -> int:
+    """Sends a request to the running daemon, printing its output as it comes
+    and returning the exit code. Returns None if no daemon is running or it
+    didn't run the command"""
 
+    import socket
 
-def _verify_lockfile_version(user_version: int) -> bool:
-    """Verifies lockfile using local tally of user_version to ensure compatibility"""
+    if not socket_path.exists():
+        return None
 
-    if user_version != OWPM_LOCKFILE_VERSION:  # NOTE: could be not hardcoded in future
-        raise ExceptionOldLockfileSpec(
-            "The .owpmlock version/specification is too new or old for owpm to recognise!"
-        )
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
+    try:
+        client.connect(str(socket_path))
+    except OSError:
+        client.close()
+        return None  # stale socket of a killed daemon
 
-def _new_lockfile_connection(lock_path: Path) -> tuple:
-    """Creates a new sqlite connection to a given lockfile"""
+    with client, client.makefile("rb") as responses:
+        client.sendall(json.dumps(request).encode() + b"\n")
 
-    conn = sqlite3.connect(str(lock_path))
-    c = conn.cursor()
+        for line in responses:
+            message = json.loads(line)
 
-    return (conn, c)
+            if "exit" in message:
+                return message["exit"]
 
+            sys.stdout.write(message["out"])
+            sys.stdout.flush()
 
-def _pypi_req(package: str) -> requests.Response:
-    """Constructs a fully-formed json request to the PyPI API using a given
-    package name"""
+    return 1  # daemon stopped mid-command
 
-    resp = requests.get(f"https://pypi.org/pypi/{package}/json")
 
-    if resp.status_code == 200:
-        return resp
-    elif resp.status_code == 404:
-        raise ExceptionPackageNotFound(
-            f"The package '{package}' was not found in pypi!"
-        )
-    else:
-        raise ExceptionApiDown(
-            f"A seemingly valid API request to PyPI has failed with error #{resp.status_code}!"
-        )
+def _owpm_environ() -> dict:
+    """Gets every OWPM_* enviroment variable, these configure the constants
+    owpm reads once on import"""
+
+    return {
+        name: value for name, value in os.environ.items() if name.startswith("OWPM_")
+    }
 
 
 def _set_venv_status(arg: dict):
-    """Sets the current venv inside of owpm data dir like owpm_venv"""
+    """Sets the cached venvs inside of owpm data dir like owpm_venv"""
+
+    import toml
 
     with open(TOML_PATH, "w+") as file:
         toml.dump(arg, file)
 
 
 def _get_venv_status() -> dict:
-    """Gets status of venv, if any are active"""
+    """Gets status of all cached venvs, if any are active"""
+
+    import toml
 
     if TOML_PATH.exists():
         with open(TOML_PATH, "r") as file:
@@ -675,8 +3475,17 @@ def _get_venv_status() -> dict:
 
 
 @click.group()
-def base_group():
-    pass
+@click.pass_context
+def base_group(ctx):
+    ctx.call_on_close(_flush_metadata_cache)
+
+    if ctx.invoked_subcommand in DAEMON_COMMANDS and not _in_daemon:
+        exit_code = _daemon_request(
+            {"cwd": os.getcwd(), "args": sys.argv[1:], "env": _owpm_environ()}
+        )
+
+        if exit_code is not None:  # ran by the daemon
+            ctx.exit(exit_code)
 
 
 @click.command()
@@ -712,7 +3521,6 @@ def add(names, dev):
     """Interactively adds a package to .owpm and saves .owpm"""
 
     proj = first_project_indir()
-    proj.remove_cached_venv()
 
     if dev:
         print("Adding development package(s)..")
@@ -747,7 +3555,6 @@ def rem(names, dev):
     with differing versions"""
 
     proj = first_project_indir()
-    proj.remove_cached_venv()
 
     found = []
 
@@ -758,11 +3565,11 @@ def rem(names, dev):
 
     removed_any_pkg = False
 
-    for package in proj.packages:
-        if package.name in names and package.is_dev == dev:
-            found.append(
-                package
-            )  # TODO: make sure it doesnt delete 2 different verions with same name
+    for name in names:
+        package = proj.find_package(name, dev)
+
+        if package is not None and package not in found:
+            found.append(package)
             removed_any_pkg = True
 
     proj.remove_packages(found)
@@ -785,14 +3592,36 @@ def rem(names, dev):
     is_flag=True,
     default=False,
 )
-def lock(force):
+@click.option(
+    "--jobs",
+    "-j",
+    help=f"Amount of packages to lock at once (default {DEFAULT_JOBS})",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+)
+@click.option(
+    "--offline",
+    help="Only uses cached package metadata, never contacting pypi",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--profile",
+    help="Saves a json report of where time was spent to this path (or OWPM_PROFILE)",
+    type=click.Path(dir_okay=False),
+    default=PROFILE_PATH,
+)
+def lock(force, jobs, offline, profile):
     """Locks the first found .owpm file"""
 
+    if profile:
+        _get_profiler().start(profile)
+
     proj = first_project_indir()
 
     print("Locking project..")
 
-    smart_locked = proj.lock_proj(force)
+    smart_locked = proj.lock_proj(force, jobs, offline)
 
     if smart_locked:
         print(
@@ -801,6 +3630,8 @@ def lock(force):
     else:
         print(f"Locked project as '{proj.name}.owpmlock'!")
 
+    _get_profiler().save("lock")
+
 
 @click.command()
 @click.option("--pin", "-p", help="Custom virtual enviroment PIN", required=False)
@@ -817,28 +3648,52 @@ def lock(force):
     is_flag=True,
     default=False,
 )
+@click.option(
+    "--jobs",
+    "-j",
+    help=f"Amount of packages to lock at once (default {DEFAULT_JOBS})",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+)
+@click.option(
+    "--offline",
+    help="Only uses cached package metadata, never contacting pypi",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--profile",
+    help="Saves a json report of where time was spent to this path (or OWPM_PROFILE)",
+    type=click.Path(dir_okay=False),
+    default=PROFILE_PATH,
+)
 @click.argument("args", nargs=-1)
-def run(pin, force, publish, args):
+def run(pin, force, publish, jobs, offline, profile, args):
     """Starts an interactive virtual enviroment or a temporary enviroment using
     args given. If a custom PIN is given, it won't use the current virtual
     enviroment cache"""
 
+    if profile:
+        _get_profiler().start(profile)
+
     proj = first_project_indir()
 
     print("Acquiring venv..")
 
     if pin is None:
-        venv = proj.build_proj(force, publish)
+        venv = proj.build_proj(force, publish, jobs, offline)
     else:
         venv = OwpmVenv(pin)
 
         if not venv.path.exists():
             print("\tGiven pin doesn't exist, creating new venv!")
-            venv = proj.build_proj(force, publish)
+            venv = proj.build_proj(force, publish, jobs, offline)
 
     # conn, c = _new_lockfile_connection(Path(f"{proj.name}.owpmlock"))
     # venv.check_venv_hashes(c)
 
+    _get_profiler().save("run")
+
     print("Starting venv..")
 
     venv.spawn_shell(" ".join(args))
@@ -861,9 +3716,31 @@ def run(pin, force, publish, args):
     is_flag=True,
     default=False,
 )
-def build(force, publish):
+@click.option(
+    "--jobs",
+    "-j",
+    help=f"Amount of packages to lock at once (default {DEFAULT_JOBS})",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+)
+@click.option(
+    "--offline",
+    help="Only uses cached package metadata, never contacting pypi",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--profile",
+    help="Saves a json report of where time was spent to this path (or OWPM_PROFILE)",
+    type=click.Path(dir_okay=False),
+    default=PROFILE_PATH,
+)
+def build(force, publish, jobs, offline, profile):
     """Constructs a new venv and provides the PIN"""
 
+    if profile:
+        _get_profiler().start(profile)
+
     proj = first_project_indir()
 
     if publish:
@@ -871,10 +3748,12 @@ def build(force, publish):
     else:
         print("Constructing new development venv..")
 
-    venv = proj.build_proj(force, publish)
+    venv = proj.build_proj(force, publish, jobs, offline)
 
     print(f"Created {venv}!")
 
+    _get_profiler().save("build")
+
 
 @click.command()
 @click.option(
@@ -892,19 +3771,31 @@ def venv_rem(pin, all):
 
 @click.command()
 def clean():
-    """Removes all virtual enviroments and cache to sort out any malfunctions"""
+    """Removes all virtual enviroments, downloaded packages and cache to sort out
+    any malfunctions"""
 
     if VENV_PATH.exists():
         print("Removing all venvs..")
 
         shutil.rmtree(VENV_PATH)
+        shutil.rmtree(VENV_LOCKS_PATH, ignore_errors=True)
     else:
         print("No venvs to remove!")
 
-    if TOML_PATH.exists():
+    if STORE_PATH.exists():
+        print("Removing downloaded packages..")
+
+        shutil.rmtree(STORE_PATH)
+    else:
+        print("No downloaded packages to remove!")
+
+    if TOML_PATH.exists() or CACHE_PATH.exists():
         print("Removing cahce..")
 
-        os.remove(TOML_PATH)
+        _close_metadata_cache()  # may be open when ran by the daemon
+        _del_path(TOML_PATH)
+        _del_path(CACHE_PATH)
+        shutil.rmtree(PROJECT_CACHE_PATH, ignore_errors=True)
     else:
         print("No cache to remove!")
 
@@ -940,23 +3831,43 @@ def venv_list():
     is_flag=True,
     default=False,
 )
-def pkg_list(lockfile):
+@click.option(
+    "--tree",
+    "-t",
+    help="Lists packages from lockfile as a tree of their dependancies",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--offline",
+    help="Only uses cached package metadata if the lockfile needs locking again",
+    is_flag=True,
+    default=False,
+)
+def pkg_list(lockfile, tree, offline):
     """Lists all packages of first found .owpm file"""
 
     proj = first_project_indir()
 
-    if lockfile:
-        print("Force-locking project..")
-        proj.lock_proj(True)
-        print("Project has been force-locked!")
+    if lockfile or tree:
+        lock_path = proj.root / f"{proj.name}.owpmlock"
 
-        print("Listing dependancies..")
+        if not proj.lock_proj(offline=offline):
+            print("Lockfile was out of date so project has been locked!")
 
-        for package in proj.packages:
-            if package.is_dep:
-                print(f"\t{package}")
+        conn, c = _open_lockfile(lock_path)
 
-        print(f"Found dependancies of count {len(proj.packages)-1}!")
+        try:
+            if tree:
+                print("Listing dependancy tree..")
+                found = _print_lock_tree(_load_dependency_graph(lock_path, c))
+            else:
+                print("Listing dependancies..")
+                found = _print_lock_rows(c)
+        finally:
+            conn.close()
+
+        print(f"Found {found} locked package(s)!")
     else:
         packages = []
         dev_packages = []
@@ -990,12 +3901,251 @@ def pkg_list(lockfile):
             print(f"Found {len(dev_packages)} development package(s)!")
 
 
+@click.command()
+@click.argument("name", required=False)
+@click.option(
+    "--why",
+    "-w",
+    help="Shows every package depending on NAME and how it is pulled in",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--path",
+    "-p",
+    "source",
+    help="Shows the shortest dependancy path from this package to NAME",
+    default=None,
+)
+@click.option(
+    "--format",
+    "-f",
+    "out_format",
+    help="Output format, dot and json export the graph or NAME's subtree",
+    type=click.Choice(["text", "dot", "json"]),
+    default="text",
+)
+@click.option(
+    "--offline",
+    help="Only uses cached package metadata if the lockfile needs locking again",
+    is_flag=True,
+    default=False,
+)
+def graph(name, why, source, out_format, offline):
+    """Queries or exports the dependancy graph of the lockfile, shows the
+    subtree of NAME if given"""
+
+    proj = first_project_indir()
+    lock_path = proj.root / f"{proj.name}.owpmlock"
+
+    if (why or source) and name is None:
+        raise click.UsageError("NAME is required for --why and --path")
+
+    quiet = out_format != "text"
+
+    if not proj.lock_proj(offline=offline) and not quiet:
+        print("Lockfile was out of date so project has been locked!")
+
+    conn, c = _open_lockfile(lock_path)
+
+    try:
+        dep_graph = _load_dependency_graph(lock_path, c)
+    finally:
+        conn.close()
+
+    if why:
+        keys = dep_graph.dependants(name)
+    elif source:
+        keys = set(dep_graph.path(name, source))
+    elif name:
+        keys = dep_graph.subtree(name)
+    else:
+        keys = None
+
+    if out_format == "dot":
+        print(dep_graph.to_dot(keys))
+        return
+    elif out_format == "json":
+        print(dep_graph.to_json(keys))
+        return
+
+    if why:
+        key = dep_graph.key(name)
+        print(f"Listing packages depending on '{name}'..")
+
+        for parent in dep_graph.parents[key]:
+            print(f"\t'{dep_graph.packages[parent][0]}' (direct)")
+
+        for dependant in sorted(keys - {key} - set(dep_graph.parents[key])):
+            print(f"\t'{dep_graph.packages[dependant][0]}'")
+
+        found_path = dep_graph.path(name)
+
+        if found_path:
+            names = " -> ".join(dep_graph.packages[key][0] for key in found_path)
+            print(f"\tPulled in by {names}..")
+
+        print(f"Found {len(keys) - 1} package(s) depending on '{name}'!")
+    elif source:
+        found_path = dep_graph.path(name, source)
+
+        if not found_path:
+            print(f"No dependancy path from '{source}' to '{name}' was found!")
+        else:
+            names = " -> ".join(dep_graph.packages[key][0] for key in found_path)
+            print(f"Found path {names}!")
+    elif name:
+        print(f"Listing dependancies of '{name}'..")
+
+        for key in sorted(keys - {dep_graph.key(name)}):
+            print(f"\t'{dep_graph.packages[key][0]}':{dep_graph.packages[key][1]}")
+
+        print(f"Found {len(keys) - 1} dependancies of '{name}'!")
+    else:
+        print("Listing dependancy tree..")
+        found = _print_lock_tree(dep_graph)
+        print(f"Found {found} locked package(s)!")
+
+
+@click.command()
+@click.argument("root", type=click.Path(exists=True, file_okay=False), default=".")
+@click.option(
+    "--force",
+    "-f",
+    help="Forces a lock of every project, even if seemingly up-to-date",
+    is_flag=True,
+    default=False,
+)
+@click.option(
+    "--jobs",
+    "-j",
+    help=f"Amount of packages to lock at once (default {DEFAULT_JOBS})",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+)
+@click.option(
+    "--offline",
+    help="Only uses cached package metadata, never contacting pypi",
+    is_flag=True,
+    default=False,
+)
+def workspace(root, force, jobs, offline):
+    """Locks every .owpm project found under ROOT at once, fetching the
+    metadata of packages shared between projects only once. Output of each
+    project is shown as a single block once it's locked"""
+
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from contextlib import redirect_stdout
+
+    projects = projects_in_tree(Path(root))
+
+    if not projects:
+        raise ExceptionOwpmNotFound(f"No .owpm files were found under '{root}'!")
+
+    print(f"Locking {len(projects)} project(s)..")
+
+    shared = SharedMetadata(jobs)  # one pool of workers for every project
+    output = ThreadOutput(sys.stdout)
+    smart_locked = 0
+    failed = []
+    started = time.perf_counter()
+
+    def lock_captured(proj: Project) -> tuple:
+        with output.capture() as captured:
+            try:
+                return (proj.lock_proj(force, jobs, offline, shared), captured)
+            except Exception as err:
+                return (err, captured)
+
+    try:
+        with redirect_stdout(output), ThreadPoolExecutor(
+            max_workers=min(len(projects), jobs)
+        ) as executor:  # these only wait on the shared workers
+            lock_futures = {
+                executor.submit(lock_captured, proj): proj for proj in projects
+            }
+
+            for future in as_completed(lock_futures):
+                proj = lock_futures[future]
+                result, captured = future.result()
+
+                for line in captured.getvalue().splitlines():
+                    print(f"\t[{proj.root / proj.name}] {line.strip()}")
+
+                if isinstance(result, Exception):
+                    failed.append(f"'{proj.root / proj.name}' ({result})")
+                elif result:
+                    print(f"\t[{proj.root / proj.name}] Already up-to-date!")
+                    smart_locked += 1
+    finally:
+        shared.close()
+
+    print(
+        f"\tFetched {len(shared.found)} unique pypi path(s) in "
+        f"{time.perf_counter() - started:.2f}s.."
+    )
+
+    if failed:
+        raise ExceptionLockFailed(
+            f"Could not lock {len(failed)} project(s): {', '.join(failed)}"
+        )
+
+    print(
+        f"Locked {len(projects) - smart_locked} project(s), "
+        f"{smart_locked} were already up-to-date!"
+    )
+
+
+@click.command()
+@click.argument("action", type=click.Choice(["start", "stop", "status", "serve"]))
+def daemon(action):
+    """Starts, stops or shows the status of the owpm daemon, which keeps
+    caches warm so commands return quickly. `serve` runs it in the foreground"""
+
+    import subprocess
+
+    if action == "serve":
+        print(f"Serving daemon on '{DAEMON_SOCKET}'..")
+        OwpmDaemon().serve()
+    elif action == "start":
+        if _daemon_request({"action": "status"}) is not None:
+            return
+
+        print("Starting daemon..")
+
+        subprocess.Popen(
+            [sys.executable, sys.argv[0], "daemon", "serve"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        for _ in range(100):  # wait for it to listen
+            time.sleep(0.05)
+
+            if _daemon_request({"action": "status"}) is not None:
+                return
+
+        raise click.ClickException("The daemon didn't start in time!")
+    elif _daemon_request({"action": action}) is None:
+        print("No daemon is running!")
+    elif action == "stop":
+        for _ in range(100):  # wait for it to stop listening
+            if not DAEMON_SOCKET.exists():
+                return
+
+            time.sleep(0.05)
+
+
 base_group.add_command(init)
 base_group.add_command(lock)
+base_group.add_command(workspace)
 
 base_group.add_command(add)
 base_group.add_command(rem)
 base_group.add_command(pkg_list)
+base_group.add_command(graph)
 
 base_group.add_command(build)
 base_group.add_command(run)
@@ -1004,5 +4154,7 @@ base_group.add_command(clean)
 base_group.add_command(venv_list)
 base_group.add_command(venv_rem)
 
+base_group.add_command(daemon)
+
 if __name__ == "__main__":
     base_group()